@@ -0,0 +1,99 @@
+# Micro-benchmark of the review extraction on a saved review list page.
+#
+# Run from the repository root:
+#     python -m benchmarks.bench_extract --rounds 200
+
+import argparse
+import os
+import timeit
+
+from bs4 import BeautifulSoup
+
+from src.extract import extract_page_items
+
+FIXTURES_PATH = os.path.join(os.path.dirname(__file__), 'fixtures')
+FIXTURE_FILE = os.path.join(FIXTURES_PATH, 'review_page.html')
+
+def extract_item_data(item_html):
+    # Baseline: the per review BeautifulSoup extractor the actor used before
+    data = {}
+    soup = BeautifulSoup(item_html, 'html.parser')
+
+    review_id_tag = soup.find(attrs={"data-reviewid": True})
+    data['review_id'] = review_id_tag['data-reviewid'] if review_id_tag else 'Review ID Not Found'
+
+    title_tag = soup.find('span', class_='noQuotes')
+    data['title'] = title_tag.text if title_tag else 'Title Not Found'
+
+    link_tag = soup.find('a', id=lambda x: x and x.startswith('rn'))
+    data['link'] = 'https://www.tripadvisor.com' + link_tag['href'] if link_tag else 'Link Not Found'
+
+    text_tag = soup.find('p', class_='partial_entry')
+    data['text'] = text_tag.text if text_tag else 'Text Not Found'
+
+    date_tag = soup.find('span', class_='ratingDate')
+    data['date'] = date_tag['title'] if date_tag else 'Date Not Found'
+
+    for li in soup.select('.rating-list .recommend-answer'):
+        description = li.find('div', class_='recommend-description')
+        rating = li.find('div', class_='ui_bubble_rating')
+        if description and rating:
+            description_key = 'rating_' + description.text.replace(' ', '_')
+            data[description_key] = rating['class'][1]
+
+    overall_rating_tag = soup.find('span', class_='ui_bubble_rating')
+    data['rating'] = overall_rating_tag['class'][1] if overall_rating_tag else 'Overall Rating Not Found'
+
+    return data
+
+def load_fixture(path=FIXTURE_FILE):
+    with open(path, 'r', encoding='utf-8') as file:
+        return file.read()
+
+def split_items(page_html):
+    # What the browser used to hand over: one outerHTML string per review
+    soup = BeautifulSoup(page_html, 'html.parser')
+    return [str(item) for item in soup.select('div[id^="review_"]')]
+
+def without_review_ids(items):
+    return [{key: value for key, value in item.items() if key != 'review_id'} for item in items]
+
+def as_extracted(item):
+    # The baseline filled missing fields with 'X Not Found' and kept the ratings as bubble classes
+    data = {}
+    for key, value in item.items():
+        if value.endswith(' Not Found'):
+            value = None
+        elif key.startswith('rating') and value.startswith('bubble_'):
+            value = int(value[len('bubble_'):]) / 10
+        data[key] = value
+    return data
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the review extractors on a saved review list page.')
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--fixture', default=FIXTURE_FILE)
+    args = parser.parse_args()
+
+    page_html = load_fixture(args.fixture)
+    item_wrappers = split_items(page_html)
+
+    baseline = [as_extracted(extract_item_data(item_html)) for item_html in item_wrappers]
+    batch = extract_page_items(page_html)
+    # The baseline only saw the review div, which has no data-reviewid, so the ids are checked on their own
+    expected_ids = [tag['data-reviewid'] for tag in BeautifulSoup(page_html, 'html.parser').select('.review-container[data-reviewid]')]
+    if [item['review_id'] for item in batch] != expected_ids:
+        raise SystemExit('The review ids extracted from the fixture are wrong, not benchmarking.')
+    if without_review_ids(baseline) != without_review_ids(batch):
+        raise SystemExit('The extractors disagree on the fixture, not benchmarking.')
+
+    baseline_time = timeit.timeit(lambda: [extract_item_data(item_html) for item_html in item_wrappers], number=args.rounds)
+    batch_time = timeit.timeit(lambda: extract_page_items(page_html), number=args.rounds)
+
+    print(f'{len(batch)} reviews per page, {args.rounds} rounds')
+    print(f'per review BeautifulSoup: {baseline_time / args.rounds * 1000:.3f} ms/page')
+    print(f'single pass lxml:         {batch_time / args.rounds * 1000:.3f} ms/page')
+    print(f'speedup:                  {baseline_time / batch_time:.1f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+# End to end benchmark of the browser path: process_website -> extraction -> dataset sink,
+# driven by a stub WebDriver that replays the saved review list pages.
+#
+# Run from the repository root:
+#     python -m benchmarks.bench_pipeline --pages 200
+#     python -m benchmarks.bench_pipeline --pages 20 --latency-scale 0.1 --tracemalloc
+#     python -m benchmarks.bench_pipeline --pages 50 --captcha-every 10 --captcha-solver fails
+#     python -m benchmarks.bench_pipeline --pages 50 --failing-pushes 3
+
+import argparse
+import asyncio
+import glob
+import logging
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+from apify import Actor
+
+from src.async_driver import AsyncDriver
+from src.blocks import PageBlockedError
+from src.captcha_solver import StubCaptchaSolver
+from src.crawl_state import CrawlState
+from src.dataset_sink import DatasetSink
+from src.main import process_website
+from src.metrics import METRICS
+from src.urls import REVIEWS_PER_PAGE
+from src.wait_policy import WaitPolicy
+
+from .fake_driver import LATENCIES, FakeDriver
+
+FIXTURES_PATH = os.path.join(os.path.dirname(__file__), 'fixtures')
+CAPTCHA_PAGE_PATH = os.path.join(FIXTURES_PATH, 'captcha_page.html')
+CAPTCHA_SOLVERS = {
+    'solves': lambda: StubCaptchaSolver(solves=True),
+    'fails': lambda: StubCaptchaSolver(solves=False),
+    'none': lambda: None,
+}
+START_URL = 'https://www.tripadvisor.com/Airline_Review-d8729116-Reviews-Malaysia_Airlines.html'
+
+class MemoryCrawlState(CrawlState):
+    # Keeps the cursors in memory instead of the key-value store
+    async def persist(self):
+        pass
+
+class CountingDataset:
+    # The first `failing_pushes` pushes fail like a dataset API that is briefly unavailable
+    def __init__(self, latency_scale=0.0, failing_pushes=0):
+        self.latency_scale = latency_scale
+        self.failing_pushes = failing_pushes
+        self.items = 0
+        self.pushes = 0
+        self.failed_pushes = 0
+        self.unique_items = set() if failing_pushes else None
+
+    async def push(self, encoded_items):
+        # Join the encoded items like the storage push does, the sink encoded them already
+        b'[' + b','.join(encoded_items) + b']'
+        if self.latency_scale:
+            await asyncio.sleep(LATENCIES['push_data'] * self.latency_scale)
+        if self.failed_pushes < self.failing_pushes:
+            self.failed_pushes += 1
+            raise ConnectionError('Dataset API unavailable')
+        self.items += len(encoded_items)
+        self.pushes += 1
+        if self.unique_items is not None:
+            self.unique_items.update(encoded_items)
+
+def load_fixture_pages(pattern):
+    pages = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, 'r', encoding='utf-8') as file:
+            pages.append(file.read())
+    if not pages:
+        raise SystemExit(f'No fixture pages match {pattern}')
+    return pages
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+async def run(fixture_pages, pages, latency_scale, batch_size, captcha_page=None, captcha_every=0, captcha_solver=None, failing_pushes=0):
+    dataset = CountingDataset(latency_scale, failing_pushes)
+    sink = DatasetSink(dataset.push, max_items=batch_size)
+    cursor = MemoryCrawlState().cursor(START_URL)
+    fake_driver = FakeDriver(fixture_pages, pages, latency_scale, captcha_page, captcha_every)
+    driver = AsyncDriver(fake_driver)
+
+    started = time.perf_counter()
+    try:
+        pages_processed = await process_website(driver, cursor, pages, sink, WaitPolicy(), captcha_solver)
+    except PageBlockedError as e:
+        # An unsolved captcha ends the URL, the actor would retry it on another proxy session
+        print(f'{e} after {cursor.pages} pages')
+        pages_processed = cursor.pages
+    finally:
+        await sink.flush()
+        await driver.quit()
+    if captcha_every:
+        attempts = len(captcha_solver.attempts) if captcha_solver is not None else 0
+        print(f'{fake_driver.captchas} captchas served, {attempts} solve attempts')
+    if failing_pushes:
+        # Failed pushes must neither lose nor duplicate reviews
+        print(f'{dataset.failed_pushes} failed pushes, {dataset.items} items pushed, {len(dataset.unique_items)} unique')
+        if dataset.items != len(dataset.unique_items) or dataset.items != cursor.pages * REVIEWS_PER_PAGE:
+            raise SystemExit('Failed pushes lost or duplicated reviews')
+    return pages_processed, dataset, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay saved review list pages through process_website and the dataset sink.')
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--latency-scale', type=float, default=0.0, help='Scale of the simulated browser latencies, 0 measures the CPU time only')
+    parser.add_argument('--batch-size', type=int, default=100, help='Items per dataset push')
+    parser.add_argument('--fixtures', default=os.path.join(FIXTURES_PATH, 'review_page*.html'))
+    parser.add_argument('--captcha-every', type=int, default=0, help='Serve every Nth page behind a captcha, 0 serves none')
+    parser.add_argument('--captcha-solver', choices=sorted(CAPTCHA_SOLVERS), default='solves', help='Stub solver that clears the captchas, fails to or is not configured')
+    parser.add_argument('--failing-pushes', type=int, default=0, help='Fail the first N dataset pushes and check that no review is lost or pushed twice')
+    parser.add_argument('--tracemalloc', action='store_true', help='Trace the allocations, slows the run down')
+    args = parser.parse_args()
+
+    Actor.log.setLevel(logging.WARNING)
+    fixture_pages = load_fixture_pages(args.fixtures)
+    captcha_page = load_fixture_pages(CAPTCHA_PAGE_PATH)[0] if args.captcha_every else None
+    captcha_solver = CAPTCHA_SOLVERS[args.captcha_solver]()
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    pages, dataset, elapsed = asyncio.run(run(fixture_pages, args.pages, args.latency_scale, args.batch_size, captcha_page, args.captcha_every, captcha_solver, args.failing_pushes))
+
+    print(f'{pages} pages, {dataset.items} items, {dataset.pushes} dataset pushes in {elapsed:.2f} s')
+    print(f'pages/s:  {pages / elapsed:.1f}')
+    print(f'items/s:  {dataset.items / elapsed:.1f}')
+    print(f'peak RSS: {peak_rss_mb():.1f} MB')
+    if args.tracemalloc:
+        _, peak_traced = tracemalloc.get_traced_memory()
+        live_blocks = len(tracemalloc.take_snapshot().traces)
+        tracemalloc.stop()
+        print(f'peak traced memory: {peak_traced / 1024 / 1024:.1f} MB, live allocations at the end: {live_blocks}')
+
+    report = METRICS.report()
+    print('per page phases (ms):')
+    for phase, summary in report['phases'].items():
+        print(f"  {phase:<24} p50 {summary['p50'] * 1000:8.2f}  p95 {summary['p95'] * 1000:8.2f}  max {summary['max'] * 1000:8.2f}")
+    for name, summary in report['gauges'].items():
+        print(f"  {name:<24} p50 {summary['p50']:8.0f}  p95 {summary['p95']:8.0f}  max {summary['max']:8.0f}")
+
+if __name__ == '__main__':
+    main()
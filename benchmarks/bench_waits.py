@@ -0,0 +1,87 @@
+# Simulated time per page with the fixed timeouts and with the adaptive wait policy.
+#
+# Every page goes through the browser waits of process_website with latencies drawn
+# from a log-normal distribution per phase. A stalled wait (a review list that never
+# renders, a list update that never finishes) costs the whole timeout. A review list
+# that times out also fails the request like process_website does: the browser is
+# replaced, the retry backoff is slept and the page starts over. Nothing sleeps, the
+# clock is simulated, so the run takes well under a second.
+#
+# Run from the repository root:
+#     python -m benchmarks.bench_waits --pages 2000 --stall-rate 0.05
+
+import argparse
+import random
+
+from src.wait_policy import DEFAULT_TIMEOUTS, WaitPolicy
+
+# Median latency (s) and log-normal sigma of the phases of a page, roughly what a residential proxy shows
+PHASE_LATENCIES = {
+    'page_load': (2.5, 0.5),
+    'reviews_list': (0.3, 0.6),
+    'review_items': (0.2, 0.6),
+    'scroll': (0.8, 0.5),
+    'list_update': (1.2, 0.5),
+}
+# A page without its review list is a block page (PageBlockedError), the request is retried
+RETRY_PHASES = ('reviews_list',)
+BROWSER_RESTART = 5.0  # Seconds to quit the browser and launch the next one
+
+class FixedWaitPolicy(WaitPolicy):
+    # The hard-coded timeouts the actor used before
+    def timeout(self, phase):
+        return self.defaults[phase]
+
+def simulate(policy, pages, stall_rate, seed):
+    rng = random.Random(seed)
+    elapsed = 0.0
+    stalls = 0
+    retries = 0
+    for _ in range(pages):
+        while True:
+            page_time, page_stalls, done = simulate_page(policy, rng, stall_rate)
+            elapsed += page_time
+            stalls += page_stalls
+            if done:
+                break
+            retries += 1
+            policy.record_error()
+            elapsed += BROWSER_RESTART + policy.backoff_delay()
+            policy.new_session()
+    return elapsed / pages, stalls, retries
+
+def simulate_page(policy, rng, stall_rate):
+    # Returns the time spent, the timeouts and False if the page failed and has to be retried
+    elapsed = 0.0
+    stalls = 0
+    for phase, (median, sigma) in PHASE_LATENCIES.items():
+        latency = rng.lognormvariate(0, sigma) * median
+        timeout = policy.timeout(phase)
+        if rng.random() < stall_rate or latency > timeout:
+            stalls += 1
+            elapsed += timeout
+            policy.timed_out(phase)
+            if phase in RETRY_PHASES:
+                return elapsed, stalls, False
+        else:
+            elapsed += latency
+            policy.observe(phase, latency)
+    return elapsed, stalls, True
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the time per page of fixed and adaptive browser waits.')
+    parser.add_argument('--pages', type=int, default=2000)
+    parser.add_argument('--stall-rate', type=float, default=0.05, help='Share of waits that never succeed')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    fixed_time, fixed_stalls, fixed_retries = simulate(FixedWaitPolicy(), args.pages, args.stall_rate, args.seed)
+    adaptive_time, adaptive_stalls, adaptive_retries = simulate(WaitPolicy(), args.pages, args.stall_rate, args.seed)
+
+    print(f'{args.pages} pages, {args.stall_rate:.0%} stalled waits, default timeouts {DEFAULT_TIMEOUTS}')
+    print(f'fixed timeouts:    {fixed_time:.2f} s/page ({fixed_stalls} timeouts, {fixed_retries} retried pages)')
+    print(f'adaptive timeouts: {adaptive_time:.2f} s/page ({adaptive_stalls} timeouts, {adaptive_retries} retried pages)')
+    print(f'speedup:           {fixed_time / adaptive_time:.2f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+# Stub of the Selenium WebDriver calls of process_website, replaying saved review list pages.
+
+import re
+import time
+
+from selenium.common.exceptions import NoSuchElementException
+from selenium.webdriver.common.by import By
+
+from src.blocks import BLOCK_SIGNALS_SCRIPT, CAPTCHA_MARKERS
+from src.captcha_solver import REMOVE_CAPTCHA_SCRIPT
+from src.http_engine import REVIEWS_LIST_ID
+from src.urls import REVIEWS_PER_PAGE, get_page_offset
+
+# Seconds every call takes with a latency scale of 1, roughly a browser behind a residential proxy
+LATENCIES = {
+    'get': 2.0,
+    'click': 0.05,
+    'list_update': 1.0,
+    'scroll': 0.8,
+    'page_source': 0.05,
+    'find': 0.005,
+    'push_data': 0.2,  # Not a driver call, an Actor.push_data API request
+}
+
+REVIEW_ID_STRIDE = 10 ** 9  # Larger than the review ids of the fixtures
+REVIEW_ID_PATTERN = re.compile(r'(id="review_|data-reviewid="|-r)(\d+)')
+
+class FakeElement:
+    def __init__(self, driver, name):
+        self.driver = driver
+        self.name = name
+
+    def click(self):
+        self.driver.click(self)
+
+class FakeDriver:
+    """Serves `page_count` review list pages built from the fixture pages.
+
+    Every page gets its own review ids, so the pages look like consecutive pages of one
+    location. Calls sleep for their latency times `latency_scale`, 0 measures the
+    actor's own CPU time only.
+
+    With a `captcha_page`, every `captcha_every`th page is served as that page first, and
+    shows the reviews once a captcha solver removes the captcha.
+    """
+
+    def __init__(self, fixture_pages, page_count, latency_scale=0.0, captcha_page=None, captcha_every=0):
+        self.fixture_pages = fixture_pages
+        self.page_count = page_count
+        self.latency_scale = latency_scale
+        self.captcha_page = captcha_page
+        self.captcha_every = captcha_every
+        self.captchas = 0
+        self.page_number = 0
+        self.current_url = 'about:blank'
+        self._page_source = None
+        self._page_behind_captcha = None
+
+    def _sleep(self, call):
+        if self.latency_scale:
+            time.sleep(LATENCIES[call] * self.latency_scale)
+
+    def _load(self, page_number):
+        self.page_number = page_number
+        fixture = self.fixture_pages[page_number % len(self.fixture_pages)]
+        self._page_source = REVIEW_ID_PATTERN.sub(lambda m: m.group(1) + str(int(m.group(2)) + page_number * REVIEW_ID_STRIDE), fixture)
+        self._page_behind_captcha = None
+        if self.captcha_page and self.captcha_every and (page_number + 1) % self.captcha_every == 0:
+            self.captchas += 1
+            self._page_behind_captcha = self._page_source
+            self._page_source = self.captcha_page
+
+    @property
+    def page_source(self):
+        self._sleep('page_source')
+        return self._page_source
+
+    def get(self, url):
+        self._sleep('get')
+        self.current_url = url
+        self._load(get_page_offset(url) // REVIEWS_PER_PAGE)
+
+    def click(self, element):
+        self._sleep('click')
+        if element.name == 'next':
+            self._sleep('list_update')
+            self._load(self.page_number + 1)
+
+    def execute_script(self, script, *args):
+        if 'readyState' in script:
+            return 'complete'
+        if script == REMOVE_CAPTCHA_SCRIPT:
+            if self._page_behind_captcha is not None:
+                self._page_source = self._page_behind_captcha
+                self._page_behind_captcha = None
+            return None
+        if script == BLOCK_SIGNALS_SCRIPT:
+            return {
+                'title': 'Reviews',
+                'captcha': any(marker in self._page_source for marker in CAPTCHA_MARKERS),
+                'datadome': False,
+                'reviewsList': REVIEWS_LIST_ID in self._page_source,
+                'reviews': self._page_source.count('id="review_'),
+                'textLength': len(self._page_source),
+            }
+        return None
+
+    def execute_async_script(self, script, *args):
+        self._sleep('scroll')
+        return round(LATENCIES['scroll'] * self.latency_scale * 1000)
+
+    def find_element(self, by, value):
+        elements = self.find_elements(by, value)
+        if not elements:
+            raise NoSuchElementException(value)
+        return elements[0]
+
+    def find_elements(self, by, value):
+        self._sleep('find')
+        if by == By.ID and value in self._page_source:
+            return [FakeElement(self, value)]
+        if by == By.CSS_SELECTOR and value.startswith('div[id^="review_"]'):
+            return [FakeElement(self, 'review')] * self._page_source.count('id="review_')
+        if by == By.CSS_SELECTOR and value == 'a.nav.next' and self.page_number < self.page_count - 1:
+            return [FakeElement(self, 'next')]
+        # No "Updating list..." indicator
+        return []
+
+    def quit(self):
+        pass
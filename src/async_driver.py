@@ -0,0 +1,65 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from selenium.webdriver.support.ui import WebDriverWait
+
+class AsyncDriver:
+    """Awaitable wrapper around a Selenium WebDriver.
+
+    Every blocking WebDriver call runs on a thread owned by this wrapper, so a slow
+    page load only blocks its own browser and never the event loop.
+    """
+
+    def __init__(self, driver, proxy_session=None):
+        self.driver = driver
+        # The sticky proxy session the browser was launched with, if any
+        self.proxy_session = proxy_session
+        # WebDriver sessions are not thread-safe, so each driver gets exactly one thread
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='webdriver')
+
+    async def run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def get(self, url):
+        return await self.run(self.driver.get, url)
+
+    async def find_element(self, by, value):
+        return await self.run(self.driver.find_element, by, value)
+
+    async def find_elements(self, by, value):
+        return await self.run(self.driver.find_elements, by, value)
+
+    async def execute_script(self, script, *args):
+        return await self.run(self.driver.execute_script, script, *args)
+
+    async def execute_async_script(self, script, *args):
+        return await self.run(self.driver.execute_async_script, script, *args)
+
+    async def execute_cdp_cmd(self, cmd, params=None):
+        return await self.run(self.driver.execute_cdp_cmd, cmd, params or {})
+
+    async def click(self, element):
+        return await self.run(element.click)
+
+    async def current_url(self):
+        return await self.run(lambda: self.driver.current_url)
+
+    async def page_source(self):
+        return await self.run(lambda: self.driver.page_source)
+
+    async def wait_until(self, condition, timeout):
+        # Raises TimeoutException like WebDriverWait.until
+        return await self.run(WebDriverWait(self.driver, timeout).until, condition)
+
+    async def wait_for_page_load(self, timeout):
+        return await self.wait_until(lambda d: d.execute_script('return document.readyState') == 'complete', timeout)
+
+    async def quit(self):
+        try:
+            await self.run(self.driver.quit)
+        finally:
+            self._executor.shutdown(wait=False)
+            if self.proxy_session is not None:
+                self.proxy_session.release()
@@ -0,0 +1,71 @@
+CAPTCHA = 'captcha'
+DATADOME = 'datadome'
+FORBIDDEN = 'forbidden'
+EMPTY = 'empty'
+
+# Reasons that mean the proxy session (IP) is flagged, not just the page
+SESSION_BLOCKS = (CAPTCHA, DATADOME, FORBIDDEN)
+
+CAPTCHA_MARKERS = ('captcha-container',)
+# The DataDome block page embeds its captcha from this host, regular pages only load the DataDome tag
+DATADOME_MARKERS = ('captcha-delivery.com',)
+FORBIDDEN_TITLES = ('403', 'access denied', 'forbidden', 'request blocked')
+MIN_PAGE_TEXT = 200  # Characters, a review list page has far more text than an error or blank page
+
+# Collects what the classifier needs in one round trip instead of a page_source transfer
+BLOCK_SIGNALS_SCRIPT = '''
+return {
+    title: document.title || '',
+    captcha: !!document.querySelector('.captcha-container'),
+    datadome: !!document.querySelector('iframe[src*="captcha-delivery.com"]'),
+    reviewsList: !!document.getElementById('taplc_location_reviews_list_sur_0'),
+    reviews: document.querySelectorAll('div[id^="review_"]').length,
+    textLength: document.body ? document.body.textContent.length : 0,
+};
+'''
+
+class PageBlockedError(Exception):
+    """Raised when TripAdvisor serves a block page instead of the reviews.
+
+    The request is retried through the request queue on another browser and proxy session.
+    """
+
+    def __init__(self, reason, url=None):
+        super().__init__(f'Page blocked ({reason})' + (f' at {url}' if url else ''))
+        self.reason = reason
+        self.url = url
+
+def classify_signals(signals, expect_reviews=False):
+    # signals is what BLOCK_SIGNALS_SCRIPT returned. A page with the reviews is never a block page,
+    # whatever its title says ('Forbidden City - Beijing - Tripadvisor').
+    if signals.get('reviewsList') or signals.get('reviews'):
+        return None
+    if signals.get('datadome'):
+        return DATADOME
+    if signals.get('captcha'):
+        return CAPTCHA
+    title = (signals.get('title') or '').lower()
+    if any(marker in title for marker in FORBIDDEN_TITLES):
+        return FORBIDDEN
+    if expect_reviews and not signals.get('reviews'):
+        return EMPTY
+    if signals.get('textLength', MIN_PAGE_TEXT) < MIN_PAGE_TEXT:
+        return EMPTY
+    return None
+
+def classify_html(status_code, page_html):
+    # Same reasons for a page fetched over HTTP
+    if status_code in (403, 429):
+        return FORBIDDEN
+    if any(marker in page_html for marker in DATADOME_MARKERS):
+        return DATADOME
+    if any(marker in page_html for marker in CAPTCHA_MARKERS):
+        return CAPTCHA
+    return None
+
+def reviews_list_or_block(driver):
+    # WebDriverWait condition: done once the reviews list or a block page shows up, whichever comes first
+    signals = driver.execute_script(BLOCK_SIGNALS_SCRIPT) or {}
+    if signals.get('reviewsList') or classify_signals(signals) in SESSION_BLOCKS:
+        return signals
+    return False
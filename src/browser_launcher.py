@@ -0,0 +1,42 @@
+import asyncio
+
+from apify import Actor
+
+class BrowserLauncher:
+    """Hands out the browsers of one worker and keeps the next one warming up.
+
+    Every time a browser is taken, the next one is launched in the background, so
+    recycling a browser or replacing a crashed one does not wait for Chrome to start.
+    `launch` is the coroutine function that starts a browser.
+    """
+
+    def __init__(self, launch, prespawn=True):
+        self._launch = launch
+        self.prespawn = prespawn
+        self._spare = None
+
+    async def take(self):
+        driver = None
+        if self._spare is not None:
+            spare, self._spare = self._spare, None
+            try:
+                driver = await spare
+            except Exception as e:
+                Actor.log.warning(f'The pre-spawned browser failed to start, launching a new one: {e}')
+        if driver is None:
+            driver = await self._launch()
+
+        if self.prespawn:
+            self._spare = asyncio.create_task(self._launch())
+        return driver
+
+    async def close(self):
+        # A launch cannot be cancelled half way, so let it finish and quit the browser
+        if self._spare is None:
+            return
+        spare, self._spare = self._spare, None
+        try:
+            driver = await spare
+            await driver.quit()
+        except Exception as e:
+            Actor.log.warning(f'Error when quitting the pre-spawned browser: {e}')
@@ -0,0 +1,77 @@
+import asyncio
+from abc import ABC, abstractmethod
+
+from apify import Actor
+from python_anticaptcha import AnticaptchaClient, NoCaptchaTaskProxylessTask
+
+SOLVE_TIMEOUT = 180  # Seconds Anti-Captcha may take for a reCAPTCHA
+
+SITE_KEY_SCRIPT = '''
+const widget = document.querySelector('.captcha-container [data-sitekey], [data-sitekey]');
+return widget ? widget.getAttribute('data-sitekey') : null;
+'''
+
+# Hands the token to the page like the reCAPTCHA widget would: the callback if there is one, else the form
+SUBMIT_TOKEN_SCRIPT = '''
+const token = arguments[0];
+document.querySelectorAll('textarea[name="g-recaptcha-response"]').forEach((textarea) => { textarea.value = token; });
+const widget = document.querySelector('[data-sitekey]');
+const callback = widget && widget.getAttribute('data-callback');
+if (callback && typeof window[callback] === 'function') {
+    window[callback](token);
+} else if (widget && widget.closest('form')) {
+    widget.closest('form').submit();
+}
+'''
+
+REMOVE_CAPTCHA_SCRIPT = '''
+document.querySelectorAll('.captcha-container').forEach((element) => element.remove());
+'''
+
+class CaptchaSolver(ABC):
+    """Optional step that clears a captcha before the page is given up as blocked.
+
+    `solve` returns True once the page shows the reviews again.
+    """
+
+    @abstractmethod
+    async def solve(self, driver, url):
+        ...
+
+class AnticaptchaSolver(CaptchaSolver):
+    """Solves reCAPTCHA v2 widgets through the Anti-Captcha service."""
+
+    def __init__(self, api_key, timeout=SOLVE_TIMEOUT):
+        self.client = AnticaptchaClient(api_key)
+        self.timeout = timeout
+
+    async def solve(self, driver, url):
+        site_key = await driver.execute_script(SITE_KEY_SCRIPT)
+        if not site_key:
+            Actor.log.warning(f'The captcha at {url} is not a reCAPTCHA, cannot solve it.')
+            return False
+        try:
+            token = await asyncio.to_thread(self._solve_recaptcha, url, site_key)
+        except Exception as e:
+            Actor.log.warning(f'Anti-Captcha failed to solve the captcha at {url}: {e}')
+            return False
+        await driver.execute_script(SUBMIT_TOKEN_SCRIPT, token)
+        return True
+
+    def _solve_recaptcha(self, url, site_key):
+        job = self.client.createTask(NoCaptchaTaskProxylessTask(website_url=url, website_key=site_key))
+        job.join(maximum_time=self.timeout)
+        return job.get_solution_response()
+
+class StubCaptchaSolver(CaptchaSolver):
+    """Solver for local runs and benchmarks, removes the captcha from the page without any service."""
+
+    def __init__(self, solves=True):
+        self.solves = solves
+        self.attempts = []
+
+    async def solve(self, driver, url):
+        self.attempts.append(url)
+        if self.solves:
+            await driver.execute_script(REMOVE_CAPTCHA_SCRIPT)
+        return self.solves
@@ -0,0 +1,162 @@
+import asyncio
+import json
+
+from apify import Actor
+
+from .urls import TRIPADVISOR_BASE_URL
+
+CAPTURE_HOST = '127.0.0.1'
+CAPTURE_QUEUE_SIZE = 1000
+CAPTURE_LINE_LIMIT = 32 * 1024 * 1024  # A single record holds a whole API response
+
+def extract_reviews_from_payload(payload):
+    # The GraphQL queries nest the reviews at different depths, so walk the whole document
+    reviews = []
+    stack = [payload]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            if is_review(node):
+                reviews.append(review_to_item(node))
+                continue
+            stack.extend(reversed(list(node.values())))
+        elif isinstance(node, list):
+            stack.extend(reversed(node))
+    return reviews
+
+def is_review(node):
+    return (
+        isinstance(node.get('id'), (int, str))
+        and isinstance(node.get('text'), str)
+        and 'rating' in node
+        and ('title' in node or 'publishedDate' in node)
+    )
+
+def review_to_item(review):
+    # Same fields as the reviews extracted from the DOM
+    data = {}
+    data['review_id'] = str(review['id'])
+    data['title'] = review.get('title') or None
+    data['link'] = TRIPADVISOR_BASE_URL + review['url'] if review.get('url') else None
+    data['text'] = review.get('text') or None
+    data['date'] = review.get('publishedDate') or review.get('createdDate') or None
+
+    for additional_rating in review.get('additionalRatings') or []:
+        label = additional_rating.get('ratingLabel')
+        rating = additional_rating.get('rating')
+        if label and rating is not None:
+            data['rating_' + label.replace(' ', '_')] = to_rating(rating)
+
+    data['rating'] = to_rating(review.get('rating'))
+    return data
+
+def to_rating(rating):
+    # The API returns the rating as a number, sometimes as a numeric string
+    try:
+        return float(rating)
+    except (TypeError, ValueError):
+        return None
+
+def parse_capture_record(line):
+    try:
+        record = json.loads(line)
+    except ValueError:
+        Actor.log.warning(f'Skipping a malformed capture record: {line[:200]}')
+        return None
+
+    if record.get('status_code') != 200:
+        Actor.log.warning(f"Error in capture of {record.get('url')} with status code: {record.get('status_code')}")
+        return None
+    return record
+
+class CaptureServer:
+    """Receives the API responses captured by save_requests.py over a local TCP socket.
+
+    The proxy addon streams one JSON record per line, tagged with the job of the
+    browser that made the request. Records are parsed as they arrive, while the
+    browser is still loading the page, and their reviews are handed to the open
+    CaptureJob with the same id. Records of unknown jobs are dropped.
+    """
+
+    def __init__(self):
+        self.address = None
+        self._server = None
+        self._jobs = {}
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, CAPTURE_HOST, 0, limit=CAPTURE_LINE_LIMIT)
+        port = self._server.sockets[0].getsockname()[1]
+        self.address = f'{CAPTURE_HOST}:{port}'
+        Actor.log.info(f'Capture server listening on {self.address}')
+        return self.address
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def open_job(self, job_id, max_pending_reviews=CAPTURE_QUEUE_SIZE):
+        job = CaptureJob(job_id, max_pending_reviews)
+        self._jobs[job_id] = job
+        return job
+
+    def close_job(self, job_id):
+        self._jobs.pop(job_id, None)
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                if not line.strip():
+                    continue
+                record = parse_capture_record(line.decode('utf-8', 'ignore'))
+                job = self._jobs.get(record.get('job')) if record else None
+                if job is not None:
+                    await job.put_reviews(extract_reviews_from_payload(record.get('data')))
+        except (ConnectionError, ValueError) as e:
+            # ValueError: a record longer than CAPTURE_LINE_LIMIT
+            Actor.log.warning(f'Capture connection closed: {e}')
+        finally:
+            writer.close()
+
+class CaptureJob:
+    """The reviews captured for one browser session.
+
+    Every review is returned only once. The queue is bounded, a full queue stops
+    reading from the socket and so pushes back on the proxy.
+    """
+
+    def __init__(self, job_id, max_pending_reviews=CAPTURE_QUEUE_SIZE):
+        self.job_id = job_id
+        self._queue = asyncio.Queue(maxsize=max_pending_reviews)
+        self._seen_review_ids = set()
+
+    async def put_reviews(self, reviews):
+        for review in reviews:
+            if review['review_id'] not in self._seen_review_ids:
+                self._seen_review_ids.add(review['review_id'])
+                await self._queue.put(review)
+
+    def mark_seen(self, review_ids):
+        # Reviews scraped from the DOM instead: drop them from the queue and from the responses still to come
+        review_ids = set(review_ids)
+        self._seen_review_ids |= review_ids
+        pending = [review for review in self.read_reviews() if review['review_id'] not in review_ids]
+        for review in pending:
+            self._queue.put_nowait(review)
+
+    def read_reviews(self):
+        reviews = []
+        while not self._queue.empty():
+            reviews.append(self._queue.get_nowait())
+        return reviews
+
+    async def wait_for_reviews(self, timeout):
+        reviews = self.read_reviews()
+        if reviews:
+            return reviews
+        try:
+            first_review = await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        return [first_review] + self.read_reviews()
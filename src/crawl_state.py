@@ -0,0 +1,109 @@
+from apify import Actor
+
+from .review_index import to_review_number
+from .urls import REVIEWS_PER_PAGE, get_page_offset
+
+CRAWL_STATE_KEY = 'CRAWL_STATE'
+
+class CrawlState:
+    """Progress of every URL that is being scraped, kept in the default key-value store.
+
+    After a migration or a crash the actor picks up each URL at the page after the
+    last one whose reviews were written to the dataset.
+    """
+
+    def __init__(self, key=CRAWL_STATE_KEY):
+        self.key = key
+        self._progress = {}
+
+    async def load(self):
+        self._progress = await Actor.get_value(self.key) or {}
+        if self._progress:
+            Actor.log.info(f'Resuming {len(self._progress)} partially scraped URLs.')
+        return self
+
+    async def persist(self):
+        await Actor.set_value(self.key, self._progress)
+
+    def cursor(self, url, review_index=None):
+        return CrawlCursor(self, url, self._progress.get(url) or {}, review_index)
+
+    async def update(self, url, progress):
+        self._progress[url] = progress
+        await self.persist()
+
+    async def remove(self, url):
+        if self._progress.pop(url, None) is not None:
+            await self.persist()
+
+class CrawlCursor:
+    """Position of the scraper within the review pages of one URL.
+
+    With a review index (incremental mode) the cursor also drops the reviews that are
+    already known and reports when a whole page was known, as the pages are sorted
+    newest first nothing new can follow.
+    """
+
+    def __init__(self, state, url, progress, review_index=None):
+        self.state = state
+        self.url = url
+        self.review_index = review_index
+        self.caught_up = False
+        # Set count_pages to have the engines fill in page_count from the first page they scrape
+        self.count_pages = False
+        # Persisted, so a fan out seed resumed after its first page can still enqueue the other pages
+        self.page_count = progress.get('page_count')
+        self.offset = progress.get('offset', get_page_offset(url))
+        self.pages = progress.get('pages', 0)
+        # Only a real review id can mark the resume point
+        self.last_review_id = progress.get('last_review_id') if is_review_id(progress.get('last_review_id')) else None
+        self._resumed = self.pages > 0
+
+    @property
+    def resumed(self):
+        return self._resumed
+
+    def skip_scraped(self, items):
+        items = self._skip_resumed(items)
+        if self.review_index is None:
+            return items
+
+        new_items = [item for item in items if item.get('review_id') not in self.review_index]
+        if items and not new_items:
+            self.caught_up = True
+        return new_items
+
+    def _skip_resumed(self, items):
+        # New reviews push older ones onto later pages, so the first page after a resume
+        # can repeat reviews that were already pushed before the restart
+        if not self._resumed or not is_review_id(self.last_review_id):
+            return items
+        self._resumed = False
+        review_ids = [item.get('review_id') for item in items]
+        if self.last_review_id not in review_ids:
+            return items
+        return items[review_ids.index(self.last_review_id) + 1:]
+
+    async def advance(self, items):
+        # Call once the reviews of the current page are in the dataset
+        self._resumed = False
+        self.offset += REVIEWS_PER_PAGE
+        self.pages += 1
+        review_ids = [item.get('review_id') for item in items if is_review_id(item.get('review_id'))]
+        if review_ids:
+            self.last_review_id = review_ids[-1]
+        if self.review_index is not None:
+            for item in items:
+                self.review_index.add(item.get('review_id'))
+        await self.state.update(self.url, {
+            'offset': self.offset,
+            'pages': self.pages,
+            'last_review_id': self.last_review_id,
+            'page_count': self.page_count,
+        })
+
+    async def finish(self):
+        await self.state.remove(self.url)
+
+def is_review_id(review_id):
+    return to_review_number(review_id) is not None
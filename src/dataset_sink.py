@@ -0,0 +1,145 @@
+import asyncio
+import time
+
+from apify import Actor
+from apify.storages.dataset import EFFECTIVE_LIMIT_BYTES
+from apify_client._errors import ApifyApiError
+
+from .metrics import METRICS
+from .review import encode_review
+
+FALLBACK_BATCH_SIZE = 100
+FALLBACK_BATCH_BYTES = 5 * 1024 * 1024  # Well below the 9 MB limit of a single dataset API call
+MAX_ITEM_BYTES = EFFECTIVE_LIMIT_BYTES  # The SDK's limit for one item and for one API call
+FALLBACK_BATCH_AGE = 10  # seconds
+
+class DatasetSink:
+    """Buffers dataset items and pushes them in batches.
+
+    A batch is pushed once it holds `max_items` items, `max_bytes` bytes of JSON or
+    its oldest item is `max_age` seconds old. Call `flush()` to push what is left,
+    the actor does so at the end of every page (`flush_page()`), on migration and on shutdown.
+
+    Items are encoded to JSON by `encode` as they are pushed, the buffer only holds the
+    encoded bytes and `push` receives a list of them. An item larger than MAX_ITEM_BYTES
+    is dropped with a warning. A batch the dataset rejects (invalid or too large data) is
+    dropped and logged, any other failure keeps it buffered for the next flush.
+    """
+
+    def __init__(self, push=None, max_items=FALLBACK_BATCH_SIZE, max_bytes=FALLBACK_BATCH_BYTES, max_age=FALLBACK_BATCH_AGE, encode=encode_review):
+        self._push = push or push_encoded_items
+        self._encode = encode
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._oldest_item_at = None
+        self._lock = asyncio.Lock()
+
+        self.items_buffered = 0
+        self.items_flushed = 0
+        self.items_dropped = 0
+        self.flushes = 0
+
+    @property
+    def pending(self):
+        return len(self._buffer)
+
+    async def push(self, item):
+        encoded_item = self._encode(item)
+        if len(encoded_item) > MAX_ITEM_BYTES:
+            self.items_dropped += 1
+            preview = encoded_item[:200].decode('utf-8', 'replace')
+            Actor.log.warning(f'Dropping a dataset item of {len(encoded_item)} bytes, the limit is {MAX_ITEM_BYTES} bytes: {preview}')
+            return
+        self._buffer.append(encoded_item)
+        self._buffer_bytes += len(encoded_item)
+        self.items_buffered += 1
+        if self._oldest_item_at is None:
+            self._oldest_item_at = time.monotonic()
+
+        if self._is_full():
+            await self.flush()
+
+    async def push_many(self, items):
+        for item in items:
+            await self.push(item)
+
+    async def flush(self):
+        async with self._lock:
+            if not self._buffer:
+                return
+            batch = self._buffer
+            self._buffer = []
+            self._buffer_bytes = 0
+            self._oldest_item_at = None
+
+            try:
+                with METRICS.timer('push_data'):
+                    await self._push(batch)
+            except Exception as e:
+                if is_rejected(e):
+                    # Retrying would fail the same way and hold back every later flush
+                    self.items_dropped += len(batch)
+                    Actor.log.error(f'The dataset rejected a batch of {len(batch)} items, dropping it: {e}')
+                    return
+                # Keep the items so the next flush retries them
+                self._buffer = batch + self._buffer
+                self._buffer_bytes = sum(len(encoded_item) for encoded_item in self._buffer)
+                self._oldest_item_at = time.monotonic()
+                raise
+
+            self.items_flushed += len(batch)
+            self.flushes += 1
+
+    async def flush_page(self):
+        # Flush at the end of a page. The cursor moves on even if the push fails: the reviews stay
+        # buffered for the next flush, while failing the request would scrape and push them twice.
+        try:
+            await self.flush()
+        except Exception as e:
+            Actor.log.warning(f'Failed to push {self.pending} items to the dataset, they are pushed with the next flush: {e}')
+
+    def stats(self):
+        return {
+            'items_buffered': self.items_buffered,
+            'items_flushed': self.items_flushed,
+            'items_pending': self.pending,
+            'items_dropped': self.items_dropped,
+            'flushes': self.flushes,
+        }
+
+    def _is_full(self):
+        return (
+            len(self._buffer) >= self.max_items
+            or self._buffer_bytes >= self.max_bytes
+            or time.monotonic() - self._oldest_item_at >= self.max_age
+        )
+
+def is_rejected(error):
+    # Validation errors of the API (4xx other than rate limiting) and of the local storage
+    if isinstance(error, ApifyApiError):
+        return 400 <= error.status_code < 500 and error.status_code != 429
+    return isinstance(error, (ValueError, TypeError))
+
+async def push_encoded_items(encoded_items):
+    # Actor.push_data would encode the items again with the json module, the storage client
+    # takes the JSON arrays as they are, chunked like the SDK does to stay below the limit of one call
+    dataset = await Actor.open_dataset()
+    for chunk in chunk_by_size(encoded_items):
+        await dataset._dataset_client.push_items((b'[' + b','.join(chunk) + b']').decode('utf-8'))
+
+def chunk_by_size(encoded_items, max_bytes=MAX_ITEM_BYTES):
+    chunk = []
+    chunk_bytes = 2  # The [] around the items
+    for encoded_item in encoded_items:
+        if chunk and chunk_bytes + len(encoded_item) > max_bytes:
+            yield chunk
+            chunk = []
+            chunk_bytes = 2
+        chunk.append(encoded_item)
+        chunk_bytes += len(encoded_item) + 1  # And the comma after it
+    if chunk:
+        yield chunk
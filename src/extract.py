@@ -0,0 +1,119 @@
+import math
+import re
+
+from lxml import etree
+from lxml import html as lxml_html
+
+from .urls import REVIEWS_PER_PAGE, TRIPADVISOR_BASE_URL
+
+def has_class(class_name):
+    # XPath equivalent of the CSS class selector '.class_name'
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')"
+
+# Selectors are compiled once at import time and reused for every page
+REVIEWS_XPATH = etree.XPath("//div[starts-with(@id, 'review_')]")
+REVIEW_ID_XPATH = etree.XPath("(descendant-or-self::*[@data-reviewid])[1]/@data-reviewid", smart_strings=False)
+# The review list puts data-reviewid on the div.review-container around div#review_<id>
+CONTAINER_REVIEW_ID_XPATH = etree.XPath("ancestor::*[@data-reviewid][1]/@data-reviewid", smart_strings=False)
+TITLE_XPATH = etree.XPath(f"(.//span[{has_class('noQuotes')}])[1]")
+LINK_XPATH = etree.XPath("(.//a[starts-with(@id, 'rn')])[1]/@href", smart_strings=False)
+TEXT_XPATH = etree.XPath(f"(.//p[{has_class('partial_entry')}])[1]")
+DATE_XPATH = etree.XPath(f"(.//span[{has_class('ratingDate')}])[1]")
+RATING_ANSWERS_XPATH = etree.XPath(f".//*[{has_class('rating-list')}]//*[{has_class('recommend-answer')}]")
+RATING_DESCRIPTION_XPATH = etree.XPath(f"(.//div[{has_class('recommend-description')}])[1]")
+RATING_BUBBLE_XPATH = etree.XPath(f"(.//div[{has_class('ui_bubble_rating')}])[1]")
+OVERALL_RATING_XPATH = etree.XPath(f"(.//span[{has_class('ui_bubble_rating')}])[1]")
+PAGE_NUMBERS_XPATH = etree.XPath(f"//*[{has_class('pageNum')}]/@data-page-number", smart_strings=False)
+REVIEW_COUNT_XPATH = etree.XPath(f"string((//*[{has_class('reviews_header_count')}])[1])", smart_strings=False)
+NON_DIGITS_PATTERN = re.compile(r'[^0-9]')
+BUBBLE_CLASS_PATTERN = re.compile(r'\bbubble_(\d+)\b')
+# The review on its own ShowUserReviews page, which shows the full text instead of the preview
+REVIEW_BY_ID_XPATH = etree.XPath("//div[@id=$review_div_id]")
+FULL_TEXT_XPATH = etree.XPath(f"(.//*[{has_class('fullText')}] | .//p[{has_class('partial_entry')}])[1]")
+# A preview ends with an ellipsis and the "More" link, whose text is part of the paragraph
+TRUNCATED_TEXT_PATTERN = re.compile(r'(\.\.\.|\u2026)\s*More\s*$')
+
+def extract_page_items(page_html):
+    # Parse the review list page once and extract every review from the same tree
+    if not page_html or not page_html.strip():
+        return []
+    root = lxml_html.fromstring(page_html)
+    return [extract_review(review) for review in REVIEWS_XPATH(root)]
+
+def extract_page_count(page_html):
+    # Number of review pages of the location, from the pagination or else from the review count
+    if not page_html or not page_html.strip():
+        return None
+    root = lxml_html.fromstring(page_html)
+
+    page_numbers = [int(number) for number in PAGE_NUMBERS_XPATH(root) if number.isdigit()]
+    if page_numbers:
+        return max(page_numbers)
+
+    review_count = NON_DIGITS_PATTERN.sub('', REVIEW_COUNT_XPATH(root))
+    if review_count:
+        return math.ceil(int(review_count) / REVIEWS_PER_PAGE)
+    return None
+
+def extract_full_text(page_html, review_id):
+    # Full text of one review from its ShowUserReviews page, None if the page only has the preview
+    if not page_html or not page_html.strip():
+        return None
+    root = lxml_html.fromstring(page_html)
+    review = first(REVIEW_BY_ID_XPATH(root, review_div_id=f'review_{review_id}'))
+    text_tag = first(FULL_TEXT_XPATH(review)) if review is not None else None
+    if text_tag is None:
+        return None
+    text = text_tag.text_content()
+    return None if is_truncated(text) else text
+
+def is_truncated(text):
+    return bool(text) and TRUNCATED_TEXT_PATTERN.search(text) is not None
+
+def extract_review(review):
+    # Missing values are None, ratings are numbers
+    data = {}
+
+    # Extracting the review ID
+    review_id = REVIEW_ID_XPATH(review) or CONTAINER_REVIEW_ID_XPATH(review)
+    if not review_id and review.get('id', '')[len('review_'):].isdigit():
+        review_id = [review.get('id')[len('review_'):]]
+    data['review_id'] = review_id[0] if review_id else None
+
+    # Extracting the title
+    title_tag = first(TITLE_XPATH(review))
+    data['title'] = title_tag.text_content() if title_tag is not None else None
+
+    # Extracting the link behind the title
+    link = LINK_XPATH(review)
+    data['link'] = TRIPADVISOR_BASE_URL + link[0] if link else None
+
+    # Extracting the text
+    text_tag = first(TEXT_XPATH(review))
+    data['text'] = text_tag.text_content() if text_tag is not None else None
+
+    # Extracting the date
+    date_tag = first(DATE_XPATH(review))
+    data['date'] = date_tag.get('title') if date_tag is not None else None
+
+    # Extracting rating-list items and ratings
+    for answer in RATING_ANSWERS_XPATH(review):
+        description = first(RATING_DESCRIPTION_XPATH(answer))
+        rating = first(RATING_BUBBLE_XPATH(answer))
+        if description is not None and rating is not None:
+            description_key = 'rating_' + description.text_content().replace(' ', '_')
+            data[description_key] = bubble_rating(rating)
+
+    # Extracting overall rating
+    overall_rating_tag = first(OVERALL_RATING_XPATH(review))
+    data['rating'] = bubble_rating(overall_rating_tag) if overall_rating_tag is not None else None
+
+    return data
+
+def first(elements):
+    return elements[0] if elements else None
+
+def bubble_rating(element):
+    # The rating is encoded in the bubble class, e.g. 'ui_bubble_rating bubble_45' for 4.5
+    match = BUBBLE_CLASS_PATTERN.search(element.get('class', ''))
+    return int(match.group(1)) / 10 if match else None
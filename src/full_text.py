@@ -0,0 +1,53 @@
+import asyncio
+
+import requests
+from apify import Actor
+
+from .extract import extract_full_text, is_truncated
+from .http_engine import create_session, fetch_page
+from .metrics import METRICS
+
+FULL_TEXT_CONCURRENCY = 5
+
+class FullTextFetcher:
+    """Completes the reviews that are still truncated from their own ShowUserReviews pages.
+
+    The pages are fetched in parallel over one pooled HTTP session, at most `concurrency`
+    at a time. A review whose page cannot be fetched keeps its preview text.
+    """
+
+    def __init__(self, proxy_url=None, concurrency=FULL_TEXT_CONCURRENCY):
+        self.session = create_session(proxy_url, concurrency)
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def complete(self, items):
+        truncated = [item for item in items if is_truncated(item.get('text'))]
+        if truncated:
+            await asyncio.gather(*[self._complete(item) for item in truncated])
+        return items
+
+    async def _complete(self, item):
+        link = item.get('link') or ''
+        if not link.startswith('http'):
+            return
+        async with self.semaphore:
+            try:
+                text = await asyncio.to_thread(self._fetch_full_text, link, item['review_id'])
+            except requests.RequestException as e:
+                Actor.log.warning(f'Failed to fetch the full text of the review at {link}: {e}')
+                text = None
+        if text is None:
+            METRICS.increment('full_text_failures')
+            return
+        item['text'] = text
+        METRICS.increment('full_texts_fetched')
+
+    def _fetch_full_text(self, link, review_id):
+        status_code, page_html = fetch_page(self.session, link)
+        if status_code != 200:
+            Actor.log.warning(f'Failed to fetch the full text of the review at {link}: status code {status_code}')
+            return None
+        return extract_full_text(page_html, review_id)
+
+    def close(self):
+        self.session.close()
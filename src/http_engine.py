@@ -0,0 +1,110 @@
+import asyncio
+import re
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from apify import Actor
+
+from .blocks import classify_html
+from .extract import extract_page_count, extract_page_items
+from .metrics import METRICS
+from .urls import REVIEWS_PER_PAGE, build_page_url, get_location_id
+
+HTTP_CONCURRENCY = 5
+HTTP_TIMEOUT = 30
+HTTP_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+
+REVIEWS_LIST_ID = 'taplc_location_reviews_list_sur_0'
+NEXT_PAGE_PATTERN = re.compile(r'<a[^>]+class="[^"]*\bnav next\b')
+
+class BrowserRequired(Exception):
+    """Raised when a review page can only be scraped with a real browser."""
+
+    def __init__(self, reason, offset):
+        super().__init__(f'{reason} at offset {offset}')
+        self.reason = reason
+        self.offset = offset
+
+def create_session(proxy_url=None, pool_size=HTTP_CONCURRENCY):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update(HTTP_HEADERS)
+    if proxy_url:
+        session.proxies = {'http': proxy_url, 'https': proxy_url}
+    return session
+
+def fetch_page(session, url):
+    with METRICS.timer('http_fetch'):
+        response = session.get(url, timeout=HTTP_TIMEOUT)
+    return response.status_code, response.text
+
+def detect_browser_required(status_code, page_html):
+    block = classify_html(status_code, page_html)
+    if block:
+        return block
+    if status_code != 200:
+        return f'unexpected status code {status_code}'
+    if REVIEWS_LIST_ID not in page_html:
+        # The reviews list is rendered client side
+        return 'reviews list missing from the HTML'
+    return None
+
+async def scrape_over_http(cursor, max_pages, sink, proxy_url=None, concurrency=HTTP_CONCURRENCY, full_text=None, page_cache=None):
+    # Fetches the review pages of a location in windows of `concurrency` pages, starting at the
+    # cursor, and pushes their reviews in page order. Raises BrowserRequired at the first page that
+    # needs Chrome, the cursor points to that page by then. With a FullTextFetcher the truncated
+    # reviews are completed from their own pages before they are pushed, with a PageCache the
+    # fetched pages are kept on disk.
+    session = create_session(proxy_url, concurrency)
+    pages_processed = 0
+
+    try:
+        while cursor.pages < max_pages:
+            offsets = [
+                cursor.offset + i * REVIEWS_PER_PAGE
+                for i in range(min(concurrency, max_pages - cursor.pages))
+            ]
+            responses = await asyncio.gather(*[
+                asyncio.to_thread(fetch_page, session, build_page_url(cursor.url, offset))
+                for offset in offsets
+            ])
+
+            for offset, (status_code, page_html) in zip(offsets, responses):
+                reason = detect_browser_required(status_code, page_html)
+                if reason:
+                    raise BrowserRequired(reason, offset)
+
+                if page_cache is not None:
+                    await asyncio.to_thread(page_cache.put, get_location_id(cursor.url), offset, page_html)
+                with METRICS.timer('extract'):
+                    items = extract_page_items(page_html)
+                METRICS.increment('pages')
+                METRICS.increment('items', len(items))
+                Actor.log.info(f'Fetched {len(items)} items over HTTP from offset {offset}.')
+                if cursor.count_pages and cursor.page_count is None:
+                    cursor.page_count = extract_page_count(page_html)
+                new_items = cursor.skip_scraped(items)
+                if full_text is not None:
+                    with METRICS.timer('full_text'):
+                        await full_text.complete(new_items)
+                await sink.push_many(new_items)
+                await sink.flush_page()
+                await cursor.advance(items)
+                pages_processed += 1
+
+                if cursor.caught_up:
+                    Actor.log.info('The whole page was scraped by an earlier run, no new reviews left.')
+                    return pages_processed
+                if len(items) < REVIEWS_PER_PAGE or not NEXT_PAGE_PATTERN.search(page_html):
+                    return pages_processed
+    finally:
+        session.close()
+
+    return pages_processed
@@ -1,5 +1,6 @@
 from urllib.parse import urljoin
 
+import asyncio
 import requests
 import time
 import re
@@ -9,12 +10,16 @@ import subprocess
 import configparser
 import uuid
 import socket
-from bs4 import BeautifulSoup
+import shutil
+import threading
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import time
-from python_anticaptcha import AnticaptchaClient, NoCaptchaTaskProxylessTask
 
 from apify import Actor
+from apify_shared.consts import ActorEventTypes
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -25,27 +30,157 @@ from selenium.common.exceptions import NoSuchElementException
 from selenium.common.exceptions import TimeoutException
 from webdriver_manager.chrome import ChromeDriverManager
 
+from .async_driver import AsyncDriver
+from .blocks import BLOCK_SIGNALS_SCRIPT, CAPTCHA, DATADOME, FORBIDDEN, PageBlockedError, classify_signals, reviews_list_or_block
+from .browser_launcher import BrowserLauncher
+from .captcha_solver import AnticaptchaSolver
+from .crawl_state import CrawlState
+from .review_index import FALLBACK_REVIEW_INDEX_STORE, ReviewIndexStore
+from .dataset_sink import FALLBACK_BATCH_SIZE, DatasetSink
+from .extract import extract_page_count, extract_page_items
+from .full_text import FULL_TEXT_CONCURRENCY, FullTextFetcher
+from .memory_guard import FALLBACK_MEMORY_LIMIT_MB, RESTART, BrowserMemoryExceeded, MemoryGuard, relieve_browser
+from .metrics import METRICS
+from .page_cache import FALLBACK_MAX_MB, FALLBACK_TTL_HOURS, PageCache
+from .proxy_pool import FALLBACK_POOL_SIZE, ProxyPool
+from .http_engine import HTTP_CONCURRENCY, BrowserRequired, scrape_over_http
+from .urls import REVIEWS_PER_PAGE, build_page_url, get_location_id
+from .wait_policy import WaitPolicy
+
 # To run this Actor locally, you need to have the Selenium Chromedriver installed.
 # https://www.selenium.dev/documentation/webdriver/getting_started/install_drivers/
 # When running on the Apify platform, it is already included in the Actor's Docker image.
 
 # Parameters
 
-LOOP_MAX = 40
-SCROLL_INCREMENT = 600  # This value might need adjusting depending on the website
 FALLBACK_URL = 'https://www.tripadvisor.com/ShowUserReviews-g1-d8729116-r933887478-Malaysia_Airlines-World.html'
 FALLBACK_MAX_PAGES = 1000
+FALLBACK_MAX_BROWSERS = 2  # Number of Chrome instances working through the request queue in parallel
+FALLBACK_MAX_PAGES_PER_BROWSER = 100  # Recycle a browser after it has served this many pages
+FALLBACK_ENGINE = 'browser'  # 'browser', 'http' or 'replay', the HTTP engine falls back to the browser when blocked
+MAX_REQUEST_RETRIES = 3
+QUEUE_POLL_INTERVAL = 1
+SCROLL_QUIET_MS = 500  # The page counts as settled once the DOM did not change for this long
+SCRIPT_TIMEOUT = 60  # Longer than the scroll timeout can grow after errors
+PIPELINE_DEPTH = 3  # Pages snapshotted by the browser that may wait for being parsed and written
+PARSER_WORKERS = 4
+WINDOW_SIZE = '1920,1080'
+
+# Requests we never need to read the reviews: images, fonts, media, ads and analytics.
+# They are aborted by Chrome before they hit the (per GB billed) proxy. A pattern is matched against
+# the whole URL, the trailing '*' also catches the query strings ('.../photo-o/....jpg?w=100&h=-1&s=1').
+BLOCKED_RESOURCE_PATTERNS = [
+    '*.png*', '*.jpg*', '*.jpeg*', '*.gif*', '*.webp*', '*.avif*', '*.svg*', '*.ico*',
+    '*.woff*', '*.ttf*', '*.otf*', '*.eot*',
+    '*.mp4*', '*.webm*', '*.m3u8*', '*.mp3*', '*.ogg*',
+]
+BLOCKED_DOMAINS = [
+    'google-analytics.com', 'googletagmanager.com', 'googlesyndication.com', 'googleadservices.com',
+    'doubleclick.net', 'adservice.google.com', 'facebook.net', 'facebook.com',
+    'amazon-adsystem.com', 'adsrvr.org', 'criteo.com', 'criteo.net', 'taboola.com', 'outbrain.com',
+    'scorecardresearch.com', 'quantserve.com', 'bing.com', 'hotjar.com', 'demdex.net', 'omtrdc.net',
+    'pubmatic.com', 'rubiconproject.com', 'casalemedia.com', 'moatads.com', 'cookielaw.org', 'onetrust.com',
+]
+
+# Jumps to the bottom of the page and resolves once no nodes were added for `quietMs`,
+# scrolling down again whenever lazy loaded content extends the page.
+SCROLL_TO_BOTTOM_SCRIPT = '''
+const [quietMs, timeoutMs, done] = arguments;
+const started = performance.now();
+let quietTimer = null;
+let finished = false;
+const finish = () => {
+    if (finished) return;
+    finished = true;
+    observer.disconnect();
+    clearTimeout(quietTimer);
+    clearTimeout(timeoutTimer);
+    done(Math.round(performance.now() - started));
+};
+const settle = () => {
+    clearTimeout(quietTimer);
+    quietTimer = setTimeout(finish, quietMs);
+};
+const observer = new MutationObserver(() => {
+    window.scrollTo(0, document.body.scrollHeight);
+    settle();
+});
+const timeoutTimer = setTimeout(finish, timeoutMs);
+observer.observe(document.body, { childList: true, subtree: true });
+window.scrollTo(0, document.body.scrollHeight);
+settle();
+'''
+
+# Expands the truncated reviews of the page. The first "More" link expands every review on the page;
+# if that did nothing by half the timeout, the remaining links are clicked one by one. Resolves with
+# the milliseconds it took, or null when previews were still left at the timeout.
+EXPAND_REVIEWS_SCRIPT = '''
+const [timeoutMs, done] = arguments;
+const moreLinks = () => document.querySelectorAll('div[id^="review_"] .partial_entry .taLnk');
+const started = performance.now();
+const initial = moreLinks().length;
+if (!initial) {
+    done(0);
+    return;
+}
+moreLinks()[0].click();
+let clickedAll = false;
+const poll = setInterval(() => {
+    const left = moreLinks().length;
+    const elapsed = performance.now() - started;
+    if (!left || elapsed >= timeoutMs) {
+        clearInterval(poll);
+        done(left ? null : Math.round(elapsed));
+    } else if (!clickedAll && left === initial && elapsed >= timeoutMs / 2) {
+        clickedAll = true;
+        moreLinks().forEach((link) => link.click());
+    }
+}, 100);
+'''
 
 STORAGE_PATH = "storage"
 PATHS = {
     'storage': STORAGE_PATH,
     'captures': os.path.join(STORAGE_PATH, "captures"),
+    'page_cache': os.path.join(STORAGE_PATH, "page_cache"),
     'stdout_log_file' : '',
     'stderr_log_file' : '',
     'captured_file': '',
     'error_file': ''
 }
 
+SETTINGS = {
+    'max_pages': FALLBACK_MAX_PAGES,
+    'max_pages_per_browser': FALLBACK_MAX_PAGES_PER_BROWSER,
+    'engine': FALLBACK_ENGINE,
+    'http_concurrency': HTTP_CONCURRENCY,
+    'dataset_batch_size': FALLBACK_BATCH_SIZE,
+    'headless': True,
+    'block_resources': True,
+    'blocked_domains': [],
+    'allowed_domains': [],
+    'fan_out': False,
+    'incremental': False,
+    'review_index_store': FALLBACK_REVIEW_INDEX_STORE,
+    'metrics': True,
+    'prespawn_browsers': True,
+    'proxy_pool_size': FALLBACK_POOL_SIZE,
+    'anticaptcha_api_key': None,
+    'full_text': False,
+    'full_text_concurrency': FULL_TEXT_CONCURRENCY,
+    'page_cache': False,
+    'page_cache_ttl_hours': FALLBACK_TTL_HOURS,
+    'page_cache_max_mb': FALLBACK_MAX_MB,
+    'memory_limit_mb': FALLBACK_MEMORY_LIMIT_MB,
+}
+
+# Parses the page snapshots of all workers, lxml releases the GIL while parsing
+PARSER_POOL = ThreadPoolExecutor(max_workers=PARSER_WORKERS, thread_name_prefix='parser')
+
+# Path of the chromedriver binary, resolved by the first browser launch of the process
+CHROMEDRIVER_PATH = None
+CHROMEDRIVER_PATH_LOCK = threading.Lock()
+
 async def main():
     async with Actor:      
         
@@ -63,25 +198,262 @@ async def main():
             Actor.log.info(f'Enqueuing {url} ...')
             await default_queue.add_request({ 'url': url})
         
-        while request := await default_queue.fetch_next_request():
+        update_settings(actor_input)
+        if SETTINGS['fan_out'] and SETTINGS['incremental']:
+            Actor.log.warning('The incremental mode needs to page through the reviews in order, not fanning out the pages.')
+            SETTINGS['fan_out'] = False
+        max_browsers = max(1, actor_input.get('max_browsers', FALLBACK_MAX_BROWSERS))
+        Actor.log.info(f"Starting {max_browsers} workers using the {SETTINGS['engine']} engine ...")
+        METRICS.enabled = SETTINGS['metrics']
+        report_labels = {'engine': SETTINGS['engine'], 'maxBrowsers': max_browsers, 'blockResources': SETTINGS['block_resources']}
+
+        # Buffer the dataset writes and make sure nothing is left in memory when the actor stops
+        sink = DatasetSink(max_items=SETTINGS['dataset_batch_size'])
+        # Page cursors of the URLs in progress, so a restarted run does not scrape them again
+        crawl_state = await CrawlState().load()
+        # Ids of the reviews scraped by earlier runs, only needed to scrape new reviews
+        review_indexes = await ReviewIndexStore.open(SETTINGS['review_index_store']) if SETTINGS['incremental'] else None
+        # Sticky proxy sessions shared by all workers, every browser keeps the one it was launched with
+        proxy_pool = await ProxyPool.open(max(SETTINGS['proxy_pool_size'], max_browsers))
+        # Solving captchas is optional, without a solver a captcha page is retried on another proxy session
+        captcha_solver = AnticaptchaSolver(SETTINGS['anticaptcha_api_key']) if SETTINGS['anticaptcha_api_key'] else None
+        # Raw pages kept on disk, the replay engine parses them again instead of scraping
+        page_cache = None
+        if SETTINGS['page_cache'] or SETTINGS['engine'] == 'replay':
+            page_cache = PageCache(PATHS['page_cache'], SETTINGS['page_cache_ttl_hours'] * 3600, SETTINGS['page_cache_max_mb'] * 1024 * 1024)
+
+        async def persist_run_state(event_data=None):
+            # Flush first, a persisted cursor or review index must never refer to reviews that are not in the dataset yet
+            await sink.flush()
+            await crawl_state.persist()
+            if review_indexes is not None:
+                await review_indexes.persist()
+            await METRICS.persist(report_labels)
+            Actor.log.info(f'Dataset sink flushed: {sink.stats()}')
+
+        Actor.on(ActorEventTypes.MIGRATING, persist_run_state)
+        Actor.on(ActorEventTypes.PERSIST_STATE, persist_run_state)
+        Actor.on(ActorEventTypes.ABORTING, persist_run_state)
+
+        try:
+            workers = [browser_worker(worker_id, default_queue, sink, crawl_state, proxy_pool, review_indexes, captcha_solver, page_cache) for worker_id in range(max_browsers)]
+            await asyncio.gather(*workers)
+        finally:
+            await persist_run_state()
+            proxy_pool.close()
+
+        Actor.log.info(f'Processing done ...')
+        clean_files()
+
+def update_settings(actor_input):
+    for key in SETTINGS:
+        if actor_input.get(key) is not None:
+            SETTINGS[key] = actor_input[key]
+    return SETTINGS
+
+async def browser_worker(worker_id, default_queue, sink, crawl_state, proxy_pool, review_indexes=None, captcha_solver=None, page_cache=None):
+    # Each worker owns one long-lived browser and keeps pulling requests until the queue is drained
+    driver = None
+    pages_on_driver = 0
+    # Waits adapt to the latencies of the current browser and its proxy session
+    wait_policy = WaitPolicy()
+    browsers = BrowserLauncher(functools.partial(launch_browser, proxy_pool), SETTINGS['prespawn_browsers'])
+    # Restarts the browser in the middle of a URL before its memory runs out
+    memory_guard = MemoryGuard(SETTINGS['memory_limit_mb']) if SETTINGS['memory_limit_mb'] else None
+
+    try:
+        while True:
+            request = await default_queue.fetch_next_request()
+            if request is None:
+                if await default_queue.is_finished():
+                    break
+                # Other workers still hold requests that may be reclaimed, keep polling
+                await asyncio.sleep(QUEUE_POLL_INTERVAL)
+                continue
+
             url = request['url']
-            Actor.log.info(f'Processing {url} ...')
+            Actor.log.info(f'[worker {worker_id}] Processing {url} ...')
 
             unique_id = str(uuid.uuid4())
-            Actor.log.info("Using unique id: "+str(unique_id))
+            Actor.log.info(f"[worker {worker_id}] Using unique id: {unique_id}")
 
             paths = update_paths(unique_id)
+            # The proxy session the request is scraped with, it gets the blame for the errors
+            proxy_session = None
+            # Fetches the full texts the page could not expand, over the request's proxy session
+            full_text = None
 
-            # Load website
-            driver = await get_driver()
-            await process_website(driver, url) 
-            driver.quit()
+            try:
+                review_index = None
+                if review_indexes is not None and get_location_id(url):
+                    review_index = await review_indexes.get(get_location_id(url))
+                cursor = crawl_state.cursor(url, review_index)
+                if cursor.resumed:
+                    Actor.log.info(f'[worker {worker_id}] Resuming {url} at offset {cursor.offset} after {cursor.pages} pages.')
+
+                # In the fan out mode the first page of a URL enqueues all other pages as requests of their own
+                is_page_request = 'page_offset' in (request.get('userData') or {})
+                fan_out = SETTINGS['fan_out'] and not is_page_request
+                max_pages = 1 if fan_out or is_page_request else SETTINGS['max_pages']
+                cursor.count_pages = fan_out
+
+                if cursor.pages >= max_pages:
+                    # Resumed after its last page was written, e.g. a fan out seed that stopped before enqueuing the pages
+                    Actor.log.info(f'[worker {worker_id}] All pages of {url} were scraped before the restart.')
+                    await finish_request(default_queue, request, cursor, fan_out, review_indexes, review_index)
+                    continue
+
+                if SETTINGS['engine'] == 'replay':
+                    await replay_cached_pages(cursor, max_pages, sink, page_cache)
+                    await finish_request(default_queue, request, cursor, fan_out, review_indexes, review_index)
+                    continue
+
+                if SETTINGS['engine'] == 'http':
+                    with METRICS.timer('proxy_setup'):
+                        proxy_session = await proxy_pool.acquire()
+                    if SETTINGS['full_text']:
+                        full_text = FullTextFetcher(proxy_session and proxy_session.url, SETTINGS['full_text_concurrency'])
+                    try:
+                        started = time.monotonic()
+                        pages = await scrape_over_http(cursor, max_pages, sink, proxy_session and proxy_session.url, SETTINGS['http_concurrency'], full_text, page_cache)
+                        proxy_pool.record_success(proxy_session, (time.monotonic() - started) / max(pages, 1))
+                        await finish_request(default_queue, request, cursor, fan_out, review_indexes, review_index)
+                        continue
+                    except BrowserRequired as e:
+                        # Continue in Chrome from the first page that could not be fetched over HTTP
+                        METRICS.increment('browser_fallbacks')
+                        Actor.log.warning(f'[worker {worker_id}] Falling back to the browser for {url}: {e}')
+                        if e.reason in (CAPTCHA, DATADOME):
+                            proxy_pool.record_captcha(proxy_session)
+                        elif e.reason == FORBIDDEN:
+                            proxy_pool.record_failure(proxy_session)
+                    finally:
+                        if proxy_session is not None:
+                            proxy_session.release()
+                        if full_text is not None:
+                            full_text.close()
+                            full_text = None
+
+                while True:
+                    if driver is None:
+                        driver = await browsers.take()
+                        pages_on_driver = 0
+                        wait_policy.new_session()
+                        if memory_guard is not None:
+                            memory_guard.new_browser()
+
+                    proxy_session = driver.proxy_session
+                    if SETTINGS['full_text'] and full_text is None:
+                        full_text = FullTextFetcher(proxy_session and proxy_session.url, SETTINGS['full_text_concurrency'])
+                    started = time.monotonic()
+                    start_pages = cursor.pages
+                    try:
+                        await process_website(driver, cursor, max_pages, sink, wait_policy, captcha_solver, full_text, page_cache, memory_guard)
+                    except BrowserMemoryExceeded as e:
+                        # Not an error of the page: continue the URL on a fresh browser where the cursor points to
+                        Actor.log.warning(f'[worker {worker_id}] {e}, continuing {url} at offset {cursor.offset} on a new browser ...')
+                        proxy_pool.record_success(proxy_session, (time.monotonic() - started) / max(cursor.pages - start_pages, 1))
+                        await quit_driver(driver)
+                        driver = None
+                        continue
+                    pages = cursor.pages - start_pages
+                    pages_on_driver += pages
+                    proxy_pool.record_success(proxy_session, (time.monotonic() - started) / max(pages, 1))
+                    break
+
+                await finish_request(default_queue, request, cursor, fan_out, review_indexes, review_index)
+            except Exception as e:
+                if isinstance(e, PageBlockedError):
+                    # An expected outcome, no traceback needed
+                    Actor.log.warning(f'[worker {worker_id}] Failed to process {url}: {e}')
+                    METRICS.increment(f'blocked_{e.reason}')
+                else:
+                    Actor.log.exception(f'[worker {worker_id}] Failed to process {url}: {e}')
+                if isinstance(e, PageBlockedError) and e.reason in (CAPTCHA, DATADOME):
+                    METRICS.increment('captchas')
+                    proxy_pool.record_captcha(proxy_session)
+                else:
+                    proxy_pool.record_failure(proxy_session)
+                # The browser may have crashed, never reuse it
+                await quit_driver(driver)
+                driver = None
+                # Back off before the next attempt, exponentially while the errors keep coming
+                wait_policy.record_error()
+                await asyncio.sleep(wait_policy.backoff_delay())
+                await retry_request(default_queue, request, str(e))
+                continue
+            finally:
+                if full_text is not None:
+                    full_text.close()
+                await process_capture(unique_id)
+                clean_files()
+
+            if driver is not None and driver.proxy_session is not None and driver.proxy_session.retired:
+                Actor.log.info(f'[worker {worker_id}] The proxy session of the browser was retired, replacing the browser ...')
+                await quit_driver(driver)
+                driver = None
+            elif pages_on_driver >= SETTINGS['max_pages_per_browser']:
+                Actor.log.info(f'[worker {worker_id}] Browser served {pages_on_driver} pages, recycling it ...')
+                await quit_driver(driver)
+                driver = None
+    finally:
+        await quit_driver(driver)
+        await browsers.close()
+
+async def launch_browser(proxy_pool):
+    with METRICS.timer('proxy_setup'):
+        proxy_session = await proxy_pool.acquire()
+    try:
+        return AsyncDriver(await get_driver(proxy_session), proxy_session)
+    except Exception:
+        if proxy_session is not None:
+            proxy_session.release()
+        raise
+
+async def finish_request(default_queue, request, cursor, fan_out, review_indexes=None, review_index=None):
+    # The pages of the request are in the dataset, enqueue the other pages of a fan out seed and forget the cursor
+    if fan_out:
+        await enqueue_pages(default_queue, cursor.url, cursor.page_count, SETTINGS['max_pages'])
+    await cursor.finish()
+    if review_index is not None:
+        await review_indexes.save(review_index)
+    await default_queue.mark_request_as_handled(request)
+
+async def enqueue_pages(default_queue, url, page_count, max_pages):
+    if not page_count:
+        Actor.log.warning(f'Could not read the number of review pages of {url}, only its first page was scraped.')
+        return
 
-            await process_capture(unique_id)
-            clean_files()
-        
-        Actor.log.info(f'Processing done ...')
-        clean_files()
+    page_count = min(page_count, max_pages)
+    Actor.log.info(f'Enqueuing {page_count - 1} more review pages of {url} ...')
+    for page_number in range(1, page_count):
+        offset = page_number * REVIEWS_PER_PAGE
+        page_url = build_page_url(url, offset)
+        # The page URL is the unique key, so a page is scraped once however often it gets enqueued
+        await default_queue.add_request({
+            'url': page_url,
+            'uniqueKey': page_url,
+            'userData': {'page_offset': offset, 'location_url': url},
+        })
+
+async def retry_request(default_queue, request, error_message):
+    METRICS.increment('retries')
+    request['retryCount'] = request.get('retryCount', 0) + 1
+    request.setdefault('errorMessages', []).append(error_message)
+
+    if request['retryCount'] > MAX_REQUEST_RETRIES:
+        Actor.log.error(f"Giving up on {request['url']} after {MAX_REQUEST_RETRIES} retries.")
+        await default_queue.mark_request_as_handled(request)
+    else:
+        await default_queue.reclaim_request(request)
+
+async def quit_driver(driver):
+    if driver is None:
+        return
+    try:
+        await driver.quit()
+    except Exception as e:
+        Actor.log.warning(f"Error when quitting the driver: {e}")
 
 def ensure_directory_exists(directory: str):
     if directory and not os.path.exists(directory):
@@ -103,169 +475,344 @@ def update_paths(unique_id: str):
 
     return PATHS
 
-async def process_website(driver, url):    
-    driver.get(url)
-    time.sleep(3)
-    keep_going = True
-
-    actor_input = await Actor.get_input() or {}
-    max_pages = actor_input.get('max_pages', FALLBACK_MAX_PAGES)
+async def process_website(driver, cursor, max_pages, sink, wait_policy, captcha_solver=None, full_text=None, page_cache=None, memory_guard=None):
+    # Start at the page the cursor points to, the first page unless the URL is being resumed
+    url = build_page_url(cursor.url, cursor.offset) if cursor.offset else cursor.url
+    try:
+        with METRICS.timer('page_load'):
+            await driver.get(url)
+            await wait_policy.wait('page_load', driver.wait_for_page_load)
+    except TimeoutException:
+        Actor.log.warning(f"Page {url} did not finish loading in time, continuing anyway...")
+
+    # The browser stage only snapshots a page and moves on to the next one. The snapshots are parsed
+    # in the parser pool and written in page order by the writer stage. The bounded queue stops the
+    # browser when the writer falls PIPELINE_DEPTH pages behind.
+    loop = asyncio.get_running_loop()
+    parsed_pages = asyncio.Queue(maxsize=PIPELINE_DEPTH)
+    writer = asyncio.create_task(write_pages(parsed_pages, sink, cursor, full_text))
+    # The cursor only advances once a page is written, count the pages from where the browser started
+    start_pages = cursor.pages
+    start_offset = cursor.offset
+    location_id = get_location_id(cursor.url)
     pages_processed = 0
 
-    while keep_going and pages_processed < max_pages:
-        await process_page(driver)
-        pages_processed += 1
+    try:
+        while start_pages + pages_processed < max_pages:
+            page_html = await snapshot_page(driver, wait_policy, captcha_solver, full_text is not None)
+            count_pages = cursor.count_pages and cursor.page_count is None and pages_processed == 0
+            parsed_page = loop.run_in_executor(PARSER_POOL, parse_page, page_html, count_pages)
+            if page_cache is not None and page_html is not None:
+                # Compressed and written in the parser pool as well, nobody waits for it
+                PARSER_POOL.submit(page_cache.put, location_id, start_offset + pages_processed * REVIEWS_PER_PAGE, page_html)
+            with METRICS.timer('pipeline_browser_blocked'):
+                await put_page(parsed_pages, parsed_page, writer)
+            METRICS.gauge('pipeline_queue_depth', parsed_pages.qsize())
+            pages_processed += 1
+
+            # Check for next page
+            if cursor.caught_up:
+                Actor.log.info("The whole page was scraped by an earlier run, no new reviews left.")
+                break
+            if start_pages + pages_processed >= max_pages:
+                Actor.log.info("Reached the maximum number of pages to process.")
+                break
+
+            action = await memory_guard.check(driver) if memory_guard is not None else None
+            if action is not None:
+                if not await driver.find_elements(By.CSS_SELECTOR, 'a.nav.next'):
+                    Actor.log.info("Next page button not found.")
+                    break
+                if action == RESTART:
+                    raise BrowserMemoryExceeded(f'Browser memory above the limit after {pages_processed} pages')
+                # Load the next page fresh instead of clicking through, the old DOM and JS heap are dropped
+                next_url = build_page_url(cursor.url, start_offset + pages_processed * REVIEWS_PER_PAGE)
+                await relieve_browser(driver)
+                try:
+                    with METRICS.timer('page_load'):
+                        await driver.get(next_url)
+                        await wait_policy.wait('page_load', driver.wait_for_page_load)
+                except TimeoutException:
+                    Actor.log.warning(f"Page {next_url} did not finish loading in time, continuing anyway...")
+                continue
 
-        # Check for next page
-        if pages_processed < max_pages:  # Only look for next page if the max limit hasn't been reached
             try:
-                scroll_to_bottom(driver)
-                next_button = driver.find_element(By.CSS_SELECTOR, 'a.nav.next')
-                next_button.click()
+                # snapshot_page already scrolled to the bottom, where the next button is
+                with METRICS.timer('list_update'):
+                    next_button = await driver.find_element(By.CSS_SELECTOR, 'a.nav.next')
+                    await driver.click(next_button)
 
-                # Wait for the text "Updating list..." to be invisible
-                wait = WebDriverWait(driver, 10)  # 10 is the timeout in seconds
-                wait.until(EC.invisibility_of_element_located((By.XPATH, "//*[contains(text(), 'Updating list...')]")))
+                    # Wait for the text "Updating list..." to be invisible
+                    list_updated = EC.invisibility_of_element_located((By.XPATH, "//*[contains(text(), 'Updating list...')]"))
+                    await wait_policy.wait('list_update', lambda timeout: driver.wait_until(list_updated, timeout))
 
             except NoSuchElementException:
-                time.sleep(30)
                 Actor.log.info("Next page button not found.")
-                keep_going = False
-        else:
-            Actor.log.info("Reached the maximum number of pages to process.")
-            keep_going = False
-    return
-
-
-async def process_page(driver):  
+                break
+    finally:
+        # Let the writer finish the pages already snapshotted, so the cursor covers them even on errors
+        await put_page(parsed_pages, None, writer)
+        await writer
+    return pages_processed
+
+async def put_page(parsed_pages, parsed_page, writer):
+    # Waits for room in the queue, unless the writer stopped, then its error is raised
+    put = asyncio.ensure_future(parsed_pages.put(parsed_page))
+    await asyncio.wait({put, writer}, return_when=asyncio.FIRST_COMPLETED)
+    if not put.done():
+        put.cancel()
+        writer.result()
+
+async def write_pages(parsed_pages, sink, cursor, full_text=None):
+    while True:
+        with METRICS.timer('pipeline_writer_starved'):
+            parsed_page = await parsed_pages.get()
+        if parsed_page is None:
+            return
+        items, page_count = await parsed_page
+        # Pages the browser snapshotted past the point where the incremental mode caught up
+        if cursor.caught_up:
+            continue
+        if page_count is not None:
+            cursor.page_count = page_count
+        await write_page(sink, cursor, items, full_text)
+
+async def process_page(driver, sink, wait_policy, cursor=None, captcha_solver=None, full_text=None):
+    # One page from start to end, for callers that do not pipeline the pages. Returns the reviews of the page.
+    page_html = await snapshot_page(driver, wait_policy, captcha_solver, full_text is not None)
+    count_pages = cursor is not None and cursor.count_pages and cursor.page_count is None
+    items, page_count = parse_page(page_html, count_pages)
+    if page_count is not None:
+        cursor.page_count = page_count
+    await write_page(sink, cursor, items, full_text)
+    return items
+
+async def snapshot_page(driver, wait_policy, captcha_solver=None, expand=False):
+    # Raises PageBlockedError on a block page, so the request is retried on another browser and proxy session
+    if not await wait_for_reviews_list(driver, wait_policy, captcha_solver):
+        Actor.log.error("The expected element did not appear in the specified time! Skipping the page...")
+        return None
 
-    url = driver.current_url
-    title = driver.title
-    check_captcha(driver)
     try:
-        # wait to load the page
-        element_present = EC.presence_of_element_located((By.ID, 'taplc_location_reviews_list_sur_0'))
-        WebDriverWait(driver, 30).until(element_present)
-        time.sleep(2)
+        # wait for the reviews to be rendered into the list
+        items_present = EC.presence_of_all_elements_located((By.CSS_SELECTOR, 'div[id^="review_"]'))
+        with METRICS.timer('review_items'):
+            await wait_policy.wait('review_items', lambda timeout: driver.wait_until(items_present, timeout))
     except TimeoutException:
-        Actor.log.error("The expected element did not appear in the specified time! Closing the driver...")
-        time.sleep(30)
-        return       
-
-    scroll_to_bottom(driver)
+        Actor.log.warning("No reviews rendered in the reviews list.")
+
+    with METRICS.timer('scroll'):
+        await scroll_to_bottom(driver, wait_policy)
+
+    if expand:
+        # The reviews left truncated are completed from their own pages before they are written
+        with METRICS.timer('expand'):
+            await expand_reviews(driver, wait_policy)
+
+    # The whole review list is parsed from this single snapshot
+    with METRICS.timer('page_source'):
+        return await driver.page_source()
+
+async def replay_cached_pages(cursor, max_pages, sink, page_cache):
+    # Parses the cached pages of the location from the cursor on, without any browser or proxy.
+    # The parser pool reads and parses a few pages ahead of the one being written.
+    location_id = get_location_id(cursor.url)
+    offsets = [offset for offset in page_cache.offsets(location_id) if offset >= cursor.offset] if location_id else []
+    if not offsets or offsets[0] != cursor.offset:
+        Actor.log.warning(f'No cached page of {cursor.url} at offset {cursor.offset}, nothing to replay.')
+        return 0
+
+    # Only the pages that follow each other without a gap, the cursor cannot skip a page
+    pages = []
+    for offset in offsets:
+        if offset != cursor.offset + len(pages) * REVIEWS_PER_PAGE or cursor.pages + len(pages) >= max_pages:
+            break
+        pages.append(offset)
 
-    item_elements = driver.find_elements(By.CSS_SELECTOR, 'div[id^="review_"]')
-    item_wrappers = [item.get_attribute('outerHTML') for item in item_elements]
+    loop = asyncio.get_running_loop()
+    parsed_pages = deque()
+    pages_processed = 0
+    try:
+        for offset in pages:
+            count_pages = cursor.count_pages and cursor.page_count is None and offset == pages[0]
+            parsed_pages.append(loop.run_in_executor(PARSER_POOL, load_cached_page, page_cache, location_id, offset, count_pages))
+            if len(parsed_pages) < PARSER_WORKERS:
+                continue
+            if not await write_cached_page(sink, cursor, await parsed_pages.popleft()):
+                return pages_processed
+            pages_processed += 1
+        while parsed_pages:
+            if not await write_cached_page(sink, cursor, await parsed_pages.popleft()):
+                return pages_processed
+            pages_processed += 1
+    finally:
+        for parsed_page in parsed_pages:
+            parsed_page.cancel()
+    return pages_processed
+
+def load_cached_page(page_cache, location_id, offset, count_pages=False):
+    # Runs in the parser pool, None once the page expired or was evicted
+    page_html = page_cache.get(location_id, offset)
+    if page_html is None:
+        return None
+    return parse_page(page_html, count_pages)
+
+async def write_cached_page(sink, cursor, parsed_page):
+    # Returns False when the replay has to stop at this page
+    if parsed_page is None:
+        Actor.log.warning(f'The cached page of {cursor.url} at offset {cursor.offset} is gone, stopping the replay.')
+        return False
+    items, page_count = parsed_page
+    if page_count is not None:
+        cursor.page_count = page_count
+    await write_page(sink, cursor, items)
+    return not cursor.caught_up
+
+def parse_page(page_html, count_pages=False):
+    # Runs in the parser pool, returns the reviews and, if asked for, the number of review pages
+    if page_html is None:
+        return [], None
+    with METRICS.timer('extract'):
+        items = extract_page_items(page_html)
+    return items, extract_page_count(page_html) if count_pages else None
+
+async def write_page(sink, cursor, items, full_text=None):
+    METRICS.increment('pages')
+    METRICS.increment('items', len(items))
 
     # Get the count of items and log them
-    item_count = len(item_wrappers)
-    Actor.log.info(f'Webscraper located {item_count} items.')
-
-    # Loop through and process each div
-    for item_html in item_wrappers:
-        item_data = extract_item_data(item_html)
+    Actor.log.info(f'Webscraper located {len(items)} items.')
+
+    # Loop through and process each review
+    new_items = cursor.skip_scraped(items) if cursor is not None else items
+    if full_text is not None:
+        # Only the reviews that get pushed are worth fetching
+        with METRICS.timer('full_text'):
+            await full_text.complete(new_items)
+    for item_data in new_items:
         if item_data is not None:
-            await Actor.push_data(item_data)
+            await sink.push(item_data)
 
-def extract_item_data(item_html):
-    data = {}
-    soup = BeautifulSoup(item_html, 'html.parser')
+    # Never keep a finished page in memory
+    await sink.flush_page()
 
-    # Extracting the review ID
-    review_id_tag = soup.find(attrs={"data-reviewid": True})
-    data['review_id'] = review_id_tag['data-reviewid'] if review_id_tag else 'Review ID Not Found'
+    if cursor is not None:
+        await cursor.advance(items)
 
-    # Extracting the title
-    title_tag = soup.find('span', class_='noQuotes')
-    data['title'] = title_tag.text if title_tag else 'Title Not Found'
-
-    # Extracting the link behind the title
-    link_tag = soup.find('a', id=lambda x: x and x.startswith('rn'))
-    data['link'] = 'https://www.tripadvisor.com' + link_tag['href'] if link_tag else 'Link Not Found'
-
-    # Extracting the text
-    text_tag = soup.find('p', class_='partial_entry')
-    data['text'] = text_tag.text if text_tag else 'Text Not Found'
-
-    # Extracting the date
-    date_tag = soup.find('span', class_='ratingDate')
-    data['date'] = date_tag['title'] if date_tag else 'Date Not Found'
-
-    # Extracting rating-list items and ratings
-    for li in soup.select('.rating-list .recommend-answer'):
-        description = li.find('div', class_='recommend-description')
-        rating = li.find('div', class_='ui_bubble_rating')
-        if description and rating:
-            description_key = 'rating_' + description.text.replace(' ', '_')
-            data[description_key] = rating['class'][1]
-
-    # Extracting overall rating
-    overall_rating_tag = soup.find('span', class_='ui_bubble_rating')
-    data['rating'] = overall_rating_tag['class'][1] if overall_rating_tag else 'Overall Rating Not Found'
-
-    return data
-
-def scroll_to_bottom(driver):
-    loop_count = 0
-    loop_max = LOOP_MAX
-    while True:
-        current_position = driver.execute_script("return window.pageYOffset;")
-        driver.execute_script(f"window.scrollTo(0, {current_position + SCROLL_INCREMENT});")
-        time.sleep(1)
-        new_height = driver.execute_script("return document.body.scrollHeight")
-        if current_position == driver.execute_script("return window.pageYOffset;"):
-            break
-        if loop_count >= loop_max:
-            break
-        loop_count += 1
-
-def check_captcha(driver):
-    # TODO: Check for captcha specific for this website Tripadvisor
-    # Check fo catpcha
-    captcha = driver.find_elements(By.CSS_SELECTOR, '.captcha-container')
-    if captcha:
-        msg = "Captcha detected! Exiting..."
-        Actor.log.error(f"An error occurred: {msg}")
-
-async def get_driver():
+async def scroll_to_bottom(driver, wait_policy):
+    # A single round trip: the browser scrolls and waits for the page to settle on its own
+    # The quiet period is spent on every page, only the time before it depends on the proxy
+    timeout_ms = round(wait_policy.timeout('scroll') * 1000) + SCROLL_QUIET_MS
     try:
-        proxy_configuration = await Actor.create_proxy_configuration()
-        proxy_url = await proxy_configuration.new_url()
-        Actor.log.info(f'Using proxy: {proxy_url}')
-        # Extracting host and port from the proxy URL
-        match = re.search(r'@(.+)$', proxy_url)
-        if match:
-            extracted_proxy_url = match.group(1)  # This will be 'proxy.apify.com:8000'
-        else:
-            extracted_proxy_url = proxy_url  # Fallback if the regex doesn't find a match
-        proxy_argument = f'--proxy-server={extracted_proxy_url}'
-
-    except Exception as e:
-        Actor.log.warning(f'Failed to set up proxy, continuing without proxy. Error: {e}')
-        proxy_argument = None
-
+        scroll_ms = await driver.execute_async_script(SCROLL_TO_BOTTOM_SCRIPT, SCROLL_QUIET_MS, timeout_ms)
+    except TimeoutException:
+        scroll_ms = None
+    if scroll_ms is None or scroll_ms >= timeout_ms:
+        Actor.log.warning("Scrolling to the bottom of the page timed out.")
+        wait_policy.timed_out('scroll')
+        return None
+    Actor.log.info(f'Scrolled to the bottom of the page in {scroll_ms} ms.')
+    wait_policy.observe('scroll', max(scroll_ms - SCROLL_QUIET_MS, 0) / 1000)
+    return scroll_ms
+
+async def expand_reviews(driver, wait_policy):
+    timeout_ms = round(wait_policy.timeout('expand') * 1000)
+    try:
+        expand_ms = await driver.execute_async_script(EXPAND_REVIEWS_SCRIPT, timeout_ms)
+    except TimeoutException:
+        expand_ms = None
+    if expand_ms is None:
+        Actor.log.warning("Could not expand all reviews of the page, fetching the rest from the review pages.")
+        wait_policy.timed_out('expand')
+        return False
+    if expand_ms:
+        wait_policy.observe('expand', expand_ms / 1000)
+    return True
+
+async def wait_for_reviews_list(driver, wait_policy, captcha_solver=None):
+    # The wait ends as soon as the reviews list or a captcha, DataDome or 403 page shows up, so a
+    # block costs one poll instead of the whole timeout. Returns False when the list never appeared.
+    for attempt in range(2):
+        try:
+            with METRICS.timer('reviews_list'):
+                signals = await wait_policy.wait('reviews_list', lambda timeout: driver.wait_until(reviews_list_or_block, timeout))
+            reason = classify_signals(signals)
+        except TimeoutException:
+            reason = classify_signals(await driver.execute_script(BLOCK_SIGNALS_SCRIPT) or {}, expect_reviews=True)
+            if reason is None:
+                return False
+        if reason is None:
+            return True
+
+        url = await driver.current_url()
+        if reason == CAPTCHA and captcha_solver is not None and attempt == 0:
+            Actor.log.info(f'Solving the captcha at {url} ...')
+            if await captcha_solver.solve(driver, url):
+                METRICS.increment('captchas_solved')
+                continue
+        raise PageBlockedError(reason, url)
+
+@METRICS.timed('driver_launch')
+async def get_driver(proxy_session=None):
     Actor.log.info('Launching Chrome WebDriver...')
-    service = Service(ChromeDriverManager().install())
+    # Launching Chrome is slow and blocking, keep it off the event loop so workers can start in parallel
+    service = Service(await asyncio.to_thread(get_chromedriver_path))
     chrome_options = ChromeOptions()
     chrome_options.add_argument('--no-sandbox')
     chrome_options.add_argument('--disable-dev-shm-usage')
     chrome_options.add_argument('--disable-translate')
     chrome_options.add_argument('--safebrowsing-disable-auto-update')
+    chrome_options.add_argument(f'--window-size={WINDOW_SIZE}')
 
     # Add proxy configuration if available
-    if proxy_argument:
-        print("+++++++++++++++++ PROXY ++++++++++++++++++++++") 
-        print(proxy_argument) 
-        chrome_options.add_argument(proxy_argument)
-
-    #if Actor.config.headless:
-        #chrome_options.add_argument('--headless')
+    if proxy_session is not None:
+        Actor.log.info(f'Using proxy session {proxy_session.id} on {proxy_session.server}')
+        # --proxy-server takes no credentials, an authenticated proxy is reached through a local relay
+        chrome_options.add_argument(f'--proxy-server={await proxy_session.chrome_proxy_server()}')
+
+    if SETTINGS['headless']:
+        chrome_options.add_argument('--headless=new')
+
+    if SETTINGS['block_resources']:
+        # Images are also switched off in the renderer, so they are not even requested
+        chrome_options.add_experimental_option('prefs', {
+            'profile.managed_default_content_settings.images': 2,
+            'profile.default_content_setting_values.notifications': 2,
+        })
         
-    driver = webdriver.Chrome(service=service, options=chrome_options)
+    driver = await asyncio.to_thread(webdriver.Chrome, service=service, options=chrome_options)
+    driver.set_script_timeout(SCRIPT_TIMEOUT)
+
+    if SETTINGS['block_resources']:
+        blocked_domains = [domain for domain in BLOCKED_DOMAINS + SETTINGS['blocked_domains'] if not is_allowed_domain(domain, SETTINGS['allowed_domains'])]
+        await asyncio.to_thread(block_resources, driver, blocked_domains)
 
     return driver
 
 
+def get_chromedriver_path():
+    # The actor image already contains chromedriver (webdriver_install.py runs at build time), so
+    # webdriver-manager, which checks the versions online, is only asked once when it is not on the PATH
+    global CHROMEDRIVER_PATH
+    with CHROMEDRIVER_PATH_LOCK:
+        if CHROMEDRIVER_PATH is None:
+            CHROMEDRIVER_PATH = os.environ.get('CHROMEDRIVER_PATH') or shutil.which('chromedriver') or ChromeDriverManager().install()
+            Actor.log.info(f'Using chromedriver {CHROMEDRIVER_PATH}')
+        return CHROMEDRIVER_PATH
+
+def is_allowed_domain(domain, allowed_domains):
+    # An allowed domain also allows its subdomains
+    return any(domain == allowed or domain.endswith('.' + allowed) for allowed in allowed_domains)
+
+def block_resources(driver, blocked_domains):
+    # Network.setBlockedURLs patterns only support '*' wildcards and apply to every tab of the session.
+    # Fetch.enable could block by resource type, but every paused request then waits for an answer to an
+    # event, which execute_cdp_cmd cannot receive. Images are blocked by type through the content setting.
+    blocked_urls = BLOCKED_RESOURCE_PATTERNS + [f'*://*.{domain}/*' for domain in blocked_domains] + [f'*://{domain}/*' for domain in blocked_domains]
+    driver.execute_cdp_cmd('Network.enable', {})
+    driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': blocked_urls})
+    Actor.log.info(f'Blocking {len(blocked_urls)} URL patterns in the browser.')
+
 async def process_capture(unique_id):
     # No need to process captured file for this scraper
     # captured_file_path = PATHS['captured_file']    
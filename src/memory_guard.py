@@ -0,0 +1,117 @@
+import asyncio
+
+import psutil
+from apify import Actor
+
+from .metrics import METRICS
+
+FALLBACK_MEMORY_LIMIT_MB = 2048
+RELIEF_RATIO = 0.75  # Above this share of the limit the page is reloaded in the same browser
+CHECK_EVERY_PAGES = 5
+MB = 1024 * 1024
+
+# What the guard tells the browser loop to do
+RELIEVE = 'relieve'
+RESTART = 'restart'
+
+class BrowserMemoryExceeded(Exception):
+    """Raised by process_website when the browser has to be restarted to continue the URL."""
+
+class MemoryGuard:
+    """Watches the memory of one worker's browser while it pages through a location.
+
+    Every `check_every` pages it samples the RSS of the Chrome process tree and the JS heap
+    of the page. Above RELIEF_RATIO of `limit_mb` the browser loop is told to relieve the
+    browser: clear its cache, drop the DOM and load the next page fresh. If the browser is
+    still above that level at the next sample, or above the limit itself, it is told to
+    restart the browser and continue at the cursor offset.
+    """
+
+    def __init__(self, limit_mb=FALLBACK_MEMORY_LIMIT_MB, check_every=CHECK_EVERY_PAGES):
+        self.limit_mb = limit_mb
+        self.check_every = check_every
+        self._pages = 0
+        self._relieved = False
+
+    def new_browser(self):
+        self._pages = 0
+        self._relieved = False
+
+    async def check(self, driver):
+        # Call once per page, returns RELIEVE, RESTART or None
+        self._pages += 1
+        if self._pages % self.check_every:
+            return None
+
+        rss_mb, js_heap_mb = await asyncio.gather(sample_browser_rss_mb(driver), sample_js_heap_mb(driver))
+        if rss_mb is not None:
+            METRICS.gauge('browser_rss_mb', rss_mb)
+        if js_heap_mb is not None:
+            METRICS.gauge('js_heap_mb', js_heap_mb)
+        # The JS heap is part of the RSS, it only decides when the process tree cannot be read
+        used_mb = rss_mb if rss_mb is not None else js_heap_mb
+        usage = f'browser RSS {format_mb(rss_mb)}, JS heap {format_mb(js_heap_mb)}, limit {self.limit_mb} MB, after {self._pages} pages'
+        if used_mb is None:
+            return None
+
+        if used_mb >= self.limit_mb or (self._relieved and used_mb >= self.limit_mb * RELIEF_RATIO):
+            METRICS.increment('memory_restarts')
+            Actor.log.warning(f'Memory guard: restarting the browser, {usage}.')
+            return RESTART
+        if used_mb >= self.limit_mb * RELIEF_RATIO:
+            self._relieved = True
+            METRICS.increment('memory_reliefs')
+            Actor.log.warning(f'Memory guard: clearing the browser cache and reloading the page, {usage}.')
+            return RELIEVE
+        self._relieved = False
+        Actor.log.info(f'Memory guard: {usage}.')
+        return None
+
+async def sample_browser_rss_mb(driver):
+    # Chromedriver, Chrome and all its renderers and helpers. Summing the RSS counts the shared
+    # pages more than once, so it errs on the safe side.
+    try:
+        pid = driver.driver.service.process.pid
+    except AttributeError:
+        return None
+    return await asyncio.to_thread(process_tree_rss_mb, pid)
+
+def process_tree_rss_mb(pid):
+    try:
+        root = psutil.Process(pid)
+        processes = [root] + root.children(recursive=True)
+    except psutil.Error:
+        return None
+    rss = 0
+    for process in processes:
+        try:
+            rss += process.memory_info().rss
+        except psutil.Error:
+            # Renderers come and go while the page is alive
+            continue
+    return rss / MB
+
+async def sample_js_heap_mb(driver):
+    try:
+        # Enabling is idempotent, the metrics stay empty without it
+        await driver.execute_cdp_cmd('Performance.enable', {})
+        metrics = await driver.execute_cdp_cmd('Performance.getMetrics', {})
+    except Exception as e:
+        Actor.log.debug(f'Cannot read the JS heap size: {e}')
+        return None
+    for metric in metrics.get('metrics', []):
+        if metric.get('name') == 'JSHeapUsedSize':
+            return metric['value'] / MB
+    return None
+
+async def relieve_browser(driver):
+    # Drops the DOM and the JS heap of the long lived review page and the cached responses
+    await driver.get('about:blank')
+    for command in ('Network.clearBrowserCache', 'HeapProfiler.collectGarbage'):
+        try:
+            await driver.execute_cdp_cmd(command, {})
+        except Exception as e:
+            Actor.log.debug(f'{command} failed: {e}')
+
+def format_mb(value):
+    return 'n/a' if value is None else f'{value:.0f} MB'
@@ -0,0 +1,128 @@
+import functools
+import math
+import os
+import time
+from array import array
+from contextlib import nullcontext
+
+from apify import Actor
+
+PERFORMANCE_REPORT_KEY = 'PERFORMANCE_REPORT'
+
+# Shared by every timer while the metrics are disabled, so a disabled timer allocates nothing
+NULL_TIMER = nullcontext()
+
+class Histogram:
+    """Durations of one phase in seconds, kept as a compact array of doubles."""
+
+    __slots__ = ('_samples',)
+
+    def __init__(self):
+        self._samples = array('d')
+
+    def observe(self, seconds):
+        self._samples.append(seconds)
+
+    def summary(self):
+        ordered = sorted(self._samples)
+        return {
+            'count': len(ordered),
+            'total': round(sum(ordered), 4),
+            'p50': round(percentile(ordered, 50), 4),
+            'p95': round(percentile(ordered, 95), 4),
+            'max': round(ordered[-1], 4),
+        }
+
+def percentile(ordered, percent):
+    # Nearest rank percentile of already sorted samples
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+class Timer:
+    __slots__ = ('metrics', 'phase', 'started')
+
+    def __init__(self, metrics, phase):
+        self.metrics = metrics
+        self.phase = phase
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.phase, time.perf_counter() - self.started)
+        return False
+
+class Metrics:
+    """Timings of the hot path phases and counters of the run.
+
+    Phases are timed with `with METRICS.timer('phase'):` or the `@METRICS.timed('phase')`
+    decorator. While disabled both hand out a shared no-op context, so the
+    instrumentation can stay in the hot path.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.started_at = time.time()
+        self._histograms = {}
+        self._gauges = {}
+        self._counters = {}
+
+    def timer(self, phase):
+        return Timer(self, phase) if self.enabled else NULL_TIMER
+
+    def timed(self, phase):
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.timer(phase):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def observe(self, phase, seconds):
+        if not self.enabled:
+            return
+        histogram = self._histograms.get(phase)
+        if histogram is None:
+            histogram = self._histograms[phase] = Histogram()
+        histogram.observe(seconds)
+
+    def gauge(self, name, value):
+        # Samples of a level, e.g. a queue depth, summarized like the phase durations
+        if not self.enabled:
+            return
+        histogram = self._gauges.get(name)
+        if histogram is None:
+            histogram = self._gauges[name] = Histogram()
+        histogram.observe(value)
+
+    def increment(self, counter, amount=1):
+        if self.enabled:
+            self._counters[counter] = self._counters.get(counter, 0) + amount
+
+    def report(self, labels=None):
+        duration_mins = max(time.time() - self.started_at, 1e-9) / 60
+        return {
+            'labels': dict(build_labels(), **(labels or {})),
+            'durationSecs': round(duration_mins * 60, 3),
+            'pagesPerMin': round(self._counters.get('pages', 0) / duration_mins, 2),
+            'itemsPerMin': round(self._counters.get('items', 0) / duration_mins, 2),
+            'counters': dict(self._counters),
+            'phases': {phase: histogram.summary() for phase, histogram in self._histograms.items()},
+            'gauges': {name: histogram.summary() for name, histogram in self._gauges.items()},
+        }
+
+    async def persist(self, labels=None):
+        if self.enabled:
+            await Actor.set_value(PERFORMANCE_REPORT_KEY, self.report(labels))
+
+def build_labels():
+    # Tell the reports of different builds and runs apart
+    return {
+        'actorBuildNumber': os.environ.get('ACTOR_BUILD_NUMBER') or os.environ.get('APIFY_ACTOR_BUILD_NUMBER'),
+        'actorRunId': os.environ.get('ACTOR_RUN_ID') or os.environ.get('APIFY_ACTOR_RUN_ID'),
+    }
+
+# Shared by all workers of the run
+METRICS = Metrics()
@@ -0,0 +1,115 @@
+import asyncio
+import os
+import socket
+import subprocess
+
+from apify import Actor
+
+MITMDUMP_SCRIPT = os.path.join("src", "save_requests.py")
+PROXY_HOST = '127.0.0.1'
+READY_TIMEOUT = 15
+READY_POLL_INTERVAL = 0.1
+STOP_TIMEOUT = 5
+WATCHDOG_INTERVAL = 1
+
+# Header the browser adds to all of its requests so the addon can tell which job a flow belongs to.
+# The addon removes it before the request leaves the proxy.
+JOB_HEADER = 'X-Capture-Job'
+
+def find_free_port():
+    # Let the OS pick a free port instead of probing ports one by one
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((PROXY_HOST, 0))
+        return s.getsockname()[1]
+
+class MitmProxyManager:
+    """Runs one mitmdump sidecar for the whole run and restarts it when it dies."""
+
+    def __init__(self, capture_address, stdout_log_file, stderr_log_file):
+        self.capture_address = capture_address
+        self.stdout_log_file = stdout_log_file
+        self.stderr_log_file = stderr_log_file
+        self.port = None
+        self.restarts = 0
+        self._process = None
+        self._watchdog = None
+
+    async def start(self):
+        self.port = find_free_port()
+        await self._launch()
+        self._watchdog = asyncio.create_task(self._watch())
+        return self.port
+
+    async def _launch(self):
+        cmd = ['mitmdump', '--quiet', '--listen-host', PROXY_HOST, '-p', str(self.port), '-s', MITMDUMP_SCRIPT]
+        # The addon streams the captured responses to the actor's capture server
+        env = dict(os.environ, CAPTURE_ADDRESS=self.capture_address)
+        with open(self.stdout_log_file, 'a') as stdout_file, open(self.stderr_log_file, 'a') as stderr_file:
+            self._process = subprocess.Popen(cmd, stdout=stdout_file, stderr=stderr_file, env=env)
+
+        await self._wait_until_ready()
+        Actor.log.info(f'Mitmproxy listening on {PROXY_HOST}:{self.port}')
+
+    async def _wait_until_ready(self):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + READY_TIMEOUT
+        while True:
+            if self._process.poll() is not None:
+                raise Exception(f"Error starting mitmproxy: {self._read_stderr()}")
+            try:
+                _, writer = await asyncio.open_connection(PROXY_HOST, self.port)
+                writer.close()
+                return
+            except OSError:
+                if loop.time() >= deadline:
+                    raise Exception(f"Mitmproxy did not start listening within {READY_TIMEOUT} s: {self._read_stderr()}")
+                await asyncio.sleep(READY_POLL_INTERVAL)
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(WATCHDOG_INTERVAL)
+            if self._process.poll() is None:
+                continue
+            Actor.log.warning(f'Mitmproxy exited with code {self._process.returncode}, restarting it on port {self.port}...')
+            try:
+                await self._launch()
+                self.restarts += 1
+            except Exception as e:
+                Actor.log.warning(f'Failed to restart mitmproxy: {e}')
+
+    def _read_stderr(self):
+        try:
+            with open(self.stderr_log_file, 'r') as stderr_file:
+                return stderr_file.read()[-2000:]
+        except OSError:
+            return ''
+
+    async def stop(self):
+        if self._watchdog is not None:
+            self._watchdog.cancel()
+            self._watchdog = None
+        if self._process is None:
+            return
+        await asyncio.to_thread(stop_process, self._process)
+        self._process = None
+
+def stop_process(process):
+    try:
+        Actor.log.info("Attempting to terminate mitmproxy...")
+        if os.name == 'nt':
+            process.kill()
+        else:
+            process.terminate()
+
+        process.wait(timeout=STOP_TIMEOUT)
+        Actor.log.info("Mitmproxy terminated successfully.")
+    except subprocess.TimeoutExpired:
+        Actor.log.warning("Mitmproxy did not terminate within the timeout, attempting to kill it...")
+        try:
+            process.kill()
+            process.wait(timeout=STOP_TIMEOUT)  # Wait for the process to be killed
+            Actor.log.info("Mitmproxy killed successfully.")
+        except Exception as e:
+            Actor.log.warning(f"Failed to kill mitmproxy: {e}")
+    except Exception as e:
+        Actor.log.warning(f"Error when stopping mitmproxy: {e}")
@@ -0,0 +1,136 @@
+import gzip
+import os
+import threading
+import time
+
+from apify import Actor
+
+FALLBACK_TTL_HOURS = 7 * 24
+FALLBACK_MAX_MB = 1024
+COMPRESS_LEVEL = 6  # Review pages shrink about 10x, higher levels cost far more CPU for little gain
+PAGE_SUFFIX = '.html.gz'
+
+class PageCache:
+    """Gzipped review list pages on disk, keyed by location id and page offset.
+
+    Pages are written as they are fetched and can be parsed again later without a
+    browser or proxy (the replay engine). Pages older than `ttl` seconds are ignored
+    and removed. Once the cache grows past `max_bytes` the least recently used pages
+    are evicted. Safe to use from the parser threads.
+    """
+
+    def __init__(self, directory, ttl=FALLBACK_TTL_HOURS * 3600, max_bytes=FALLBACK_MAX_MB * 1024 * 1024):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # path -> (size, last use), the last use is kept on disk as the access time of the file
+        self._entries = {}
+        self._total_bytes = 0
+        self._scan()
+
+    def _scan(self):
+        expired = 0
+        for location_id in os.listdir(self.directory) if os.path.isdir(self.directory) else []:
+            location_directory = os.path.join(self.directory, location_id)
+            if not os.path.isdir(location_directory):
+                continue
+            for name in os.listdir(location_directory):
+                path = os.path.join(location_directory, name)
+                stat = os.stat(path)
+                # Leftovers of a write that was cut short count as expired
+                if not name.endswith(PAGE_SUFFIX) or self._expired(stat.st_mtime):
+                    self._remove(path)
+                    expired += 1
+                    continue
+                self._entries[path] = (stat.st_size, stat.st_atime)
+                self._total_bytes += stat.st_size
+        self._evict()
+        Actor.log.info(f'Page cache at {self.directory} holds {len(self._entries)} pages ({self._total_bytes / 1024 / 1024:.1f} MB), {expired} expired pages removed.')
+
+    def path(self, location_id, offset):
+        return os.path.join(self.directory, str(location_id), f'{offset}{PAGE_SUFFIX}')
+
+    def put(self, location_id, offset, page_html):
+        if location_id is None or not page_html:
+            return
+        data = gzip.compress(page_html.encode('utf-8'), compresslevel=COMPRESS_LEVEL)
+        path = self.path(location_id, offset)
+        # Written under another name first, a reader never sees half a page
+        temporary_path = f'{path}.{threading.get_ident()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temporary_path, 'wb') as file:
+                file.write(data)
+            os.replace(temporary_path, path)
+        except OSError as e:
+            # A full disk must not stop the scrape, the page just is not cached
+            Actor.log.warning(f'Failed to cache the page at offset {offset} of location {location_id}: {e}')
+            self._remove(temporary_path)
+            return
+
+        with self._lock:
+            size, _ = self._entries.get(path, (0, None))
+            self._entries[path] = (len(data), time.time())
+            self._total_bytes += len(data) - size
+            self._evict()
+
+    def get(self, location_id, offset):
+        path = self.path(location_id, offset)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None:
+                return None
+            try:
+                stored_at = os.stat(path).st_mtime
+            except FileNotFoundError:
+                stored_at = 0
+            if not stored_at or self._expired(stored_at):
+                self._drop(path)
+                return None
+            now = time.time()
+            self._entries[path] = (entry[0], now)
+        try:
+            os.utime(path, (now, stored_at))
+            with open(path, 'rb') as file:
+                return gzip.decompress(file.read()).decode('utf-8')
+        except FileNotFoundError:
+            # Evicted by another thread in the meantime
+            return None
+
+    def offsets(self, location_id):
+        # Offsets of the cached pages of a location, in page order
+        prefix = os.path.join(self.directory, str(location_id), '')
+        with self._lock:
+            paths = [path for path in self._entries if path.startswith(prefix)]
+        return sorted(int(os.path.basename(path)[:-len(PAGE_SUFFIX)]) for path in paths)
+
+    def stats(self):
+        return {'pages': len(self._entries), 'bytes': self._total_bytes}
+
+    def _expired(self, stored_at):
+        return self.ttl and time.time() - stored_at > self.ttl
+
+    def _evict(self):
+        # Called with the lock held
+        if self._total_bytes <= self.max_bytes:
+            return
+        evicted = 0
+        for path, _ in sorted(self._entries.items(), key=lambda entry: entry[1][1]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            self._drop(path)
+            evicted += 1
+        Actor.log.info(f'Evicted {evicted} least recently used pages from the page cache.')
+
+    def _drop(self, path):
+        size, _ = self._entries.pop(path)
+        self._total_bytes -= size
+        self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,159 @@
+import uuid
+from collections import deque
+from urllib.parse import unquote, urlsplit
+
+from apify import Actor
+
+from .proxy_relay import ProxyRelay
+
+FALLBACK_POOL_SIZE = 10
+MIN_ATTEMPTS = 3  # Requests a session serves before its success rate counts
+MIN_SCORE = 0.3  # Sessions scoring lower are retired
+GOOD_SCORE = 0.7  # Idle sessions scoring at least this are reused before opening new ones
+MAX_CAPTCHAS = 2  # A session is retired at this many captchas, whatever its score
+CAPTCHA_PENALTY = 0.5  # Every captcha multiplies the score by this
+LATENCY_TARGET = 10  # Seconds per page, slower sessions lose score in proportion
+LATENCY_WINDOW = 20
+
+class ProxySession:
+    """One sticky session (and so one IP) of the proxy and how well it has been doing."""
+
+    def __init__(self, session_id, url):
+        self.id = session_id
+        self.url = url
+        self.successes = 0
+        self.failures = 0
+        self.captchas = 0
+        self.users = 0
+        self.retired = False
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self._relay = None
+
+    @property
+    def score(self):
+        # Smoothed success rate, so a new session starts at 0.5 and one failure does not sink it
+        success_rate = (self.successes + 1) / (self.successes + self.failures + 2)
+        latency_factor = 1.0
+        if self.latencies:
+            latency_factor = min(1.0, LATENCY_TARGET / (sum(self.latencies) / len(self.latencies)))
+        return success_rate * latency_factor * CAPTCHA_PENALTY ** self.captchas
+
+    @property
+    def server(self):
+        # Chrome's --proxy-server takes no credentials
+        parts = urlsplit(self.url)
+        return f'{parts.scheme}://{parts.hostname}:{parts.port}'
+
+    def credentials(self):
+        parts = urlsplit(self.url)
+        if not parts.username:
+            return None
+        return unquote(parts.username), unquote(parts.password or '')
+
+    async def chrome_proxy_server(self):
+        # What Chrome's --proxy-server points to: the proxy itself, or a local relay that adds the credentials
+        credentials = self.credentials()
+        if credentials is None:
+            return self.server
+        if self._relay is None:
+            parts = urlsplit(self.url)
+            self._relay = ProxyRelay(parts.hostname, parts.port, *credentials)
+        return await self._relay.start()
+
+    def release(self):
+        self.users = max(0, self.users - 1)
+        if self.retired and self.users == 0:
+            self.close()
+
+    def close(self):
+        if self._relay is not None:
+            self._relay.close()
+            self._relay = None
+
+    def __repr__(self):
+        return f'ProxySession({self.id}, score={self.score:.2f}, successes={self.successes}, failures={self.failures}, captchas={self.captchas})'
+
+class ProxyPool:
+    """Sticky proxy sessions shared by all browsers and HTTP clients of the run.
+
+    A browser keeps the session it was launched with. Sessions are scored by their
+    success rate, page latency and captcha hits; the ones that fall below MIN_SCORE
+    are retired and replaced by new ones, the good ones are handed out again.
+    """
+
+    def __init__(self, proxy_configuration, size=FALLBACK_POOL_SIZE):
+        self.proxy_configuration = proxy_configuration
+        self.size = size
+        self._sessions = []
+
+    @classmethod
+    async def open(cls, size=FALLBACK_POOL_SIZE):
+        try:
+            proxy_configuration = await Actor.create_proxy_configuration()
+        except Exception as e:
+            Actor.log.warning(f'Failed to set up proxy, continuing without proxy. Error: {e}')
+            proxy_configuration = None
+        return cls(proxy_configuration, size)
+
+    @property
+    def sessions(self):
+        return list(self._sessions)
+
+    async def acquire(self):
+        if self.proxy_configuration is None:
+            return None
+
+        sessions = self.sessions
+        idle_good = [session for session in sessions if session.users == 0 and session.score >= GOOD_SCORE]
+        if idle_good:
+            session = max(idle_good, key=lambda session: session.score)
+        elif len(sessions) < self.size:
+            session = await self._new_session()
+        else:
+            session = max(sessions, key=lambda session: (session.score, -session.users))
+        session.users += 1
+        return session
+
+    async def _new_session(self):
+        session_id = f'session_{uuid.uuid4().hex[:12]}'
+        session = ProxySession(session_id, await self.proxy_configuration.new_url(session_id))
+        self._sessions.append(session)
+        Actor.log.info(f'Opened proxy session {session_id}')
+        return session
+
+    def record_success(self, session, seconds=None):
+        if session is None:
+            return
+        session.successes += 1
+        if seconds is not None:
+            session.latencies.append(seconds)
+        self._check(session)
+
+    def record_failure(self, session):
+        if session is None:
+            return
+        session.failures += 1
+        self._check(session)
+
+    def record_captcha(self, session):
+        if session is None:
+            return
+        session.captchas += 1
+        session.failures += 1
+        self._check(session)
+
+    def _check(self, session):
+        if session.retired:
+            return
+        attempts = session.successes + session.failures
+        if session.captchas >= MAX_CAPTCHAS or (attempts >= MIN_ATTEMPTS and session.score < MIN_SCORE):
+            session.retired = True
+            self._sessions.remove(session)
+            if session.users == 0:
+                session.close()
+            Actor.log.info(f'Retired {session}')
+
+    def close(self):
+        # Sessions still in use by a browser are closed by their release()
+        for session in self._sessions:
+            session.close()
@@ -0,0 +1,78 @@
+import asyncio
+import base64
+
+from apify import Actor
+
+RELAY_HOST = '127.0.0.1'
+BUFFER_SIZE = 64 * 1024
+MAX_HEADER_SIZE = 64 * 1024
+
+class ProxyRelay:
+    """Local proxy without authentication in front of an authenticated upstream proxy.
+
+    Chrome takes no proxy credentials on the command line, and recent Chrome builds ignore
+    --load-extension, so an extension cannot answer the 407 challenge either. Chrome talks to
+    this relay instead, which adds the Proxy-Authorization header to every request (CONNECT
+    for HTTPS) and then passes the bytes through. The credentials never touch the disk.
+    """
+
+    def __init__(self, upstream_host, upstream_port, username, password):
+        self.upstream_host = upstream_host
+        self.upstream_port = upstream_port
+        token = base64.b64encode(f'{username}:{password}'.encode('utf-8')).decode('ascii')
+        self._authorization = f'Proxy-Authorization: Basic {token}'.encode('ascii')
+        self._server = None
+        self.port = None
+
+    @property
+    def url(self):
+        return f'http://{RELAY_HOST}:{self.port}'
+
+    async def start(self):
+        if self._server is None:
+            self._server = await asyncio.start_server(self._handle_connection, RELAY_HOST, 0, limit=MAX_HEADER_SIZE)
+            self.port = self._server.sockets[0].getsockname()[1]
+        return self.url
+
+    def close(self):
+        # Stops accepting connections, the open tunnels end with their browser
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+
+    async def _handle_connection(self, reader, writer):
+        upstream_writer = None
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+            upstream_reader, upstream_writer = await asyncio.open_connection(self.upstream_host, self.upstream_port)
+            upstream_writer.write(self._authorize(head))
+            await upstream_writer.drain()
+            await asyncio.gather(pipe(reader, upstream_writer), pipe(upstream_reader, writer))
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        except OSError as e:
+            Actor.log.warning(f'Proxy relay cannot reach {self.upstream_host}:{self.upstream_port}: {e}')
+        finally:
+            for stream_writer in (writer, upstream_writer):
+                if stream_writer is not None:
+                    stream_writer.close()
+
+    def _authorize(self, head):
+        request_line, *headers = head[:-4].split(b'\r\n')
+        headers = [header for header in headers if not header.lower().startswith(b'proxy-authorization:')]
+        if not request_line.upper().startswith(b'CONNECT '):
+            # Only the first request of a connection carries the header, so plain HTTP gets one request per connection
+            headers = [header for header in headers if not header.lower().startswith((b'connection:', b'proxy-connection:'))]
+            headers.append(b'Connection: close')
+        headers.append(self._authorization)
+        return b'\r\n'.join([request_line, *headers]) + b'\r\n\r\n'
+
+async def pipe(reader, writer):
+    try:
+        while data := await reader.read(BUFFER_SIZE):
+            writer.write(data)
+            await writer.drain()
+        if writer.can_write_eof():
+            writer.write_eof()
+    except OSError:
+        pass
@@ -0,0 +1,135 @@
+import re
+from dataclasses import dataclass, fields
+from datetime import datetime
+
+import orjson
+from apify import Actor
+
+from .extract import TRUNCATED_TEXT_PATTERN
+
+REVIEW_ID_IN_LINK_PATTERN = re.compile(r'-r(\d+)-')
+LABEL_SEPARATORS_PATTERN = re.compile(r'[^a-z0-9]+')
+DATE_FORMATS = ('%B %d, %Y', '%b %d, %Y', '%d %B %Y', '%d %b %Y')
+MAX_RATING = 5
+
+@dataclass(slots=True)
+class Review:
+    """One review as stored in the dataset.
+
+    Missing values are None. Ratings are numbers from 0 to 5 in steps of 0.5, the date
+    is an ISO date. The sub-ratings are the fixed sets TripAdvisor asks airline, hotel and
+    restaurant reviewers for, a review only fills in those of its kind of location and
+    `to_dict` leaves out the rest.
+    """
+
+    review_id: int | None = None
+    title: str | None = None
+    link: str | None = None
+    text: str | None = None
+    date: str | None = None
+    rating: float | None = None
+    # Airlines
+    rating_legroom: float | None = None
+    rating_seat_comfort: float | None = None
+    rating_in_flight_entertainment: float | None = None
+    rating_customer_service: float | None = None
+    rating_value_for_money: float | None = None
+    rating_cleanliness: float | None = None
+    rating_check_in_and_boarding: float | None = None
+    rating_food_and_beverage: float | None = None
+    # Hotels
+    rating_location: float | None = None
+    rating_rooms: float | None = None
+    rating_service: float | None = None
+    rating_sleep_quality: float | None = None
+    rating_value: float | None = None
+    # Restaurants, which share service and value with hotels
+    rating_food: float | None = None
+    rating_atmosphere: float | None = None
+
+    @classmethod
+    def from_item(cls, item):
+        # item is a review as extracted from the page or the API, with strings only
+        link = value_or_none(item.get('link'))
+        review = cls(
+            review_id=parse_review_id(item.get('review_id'), link),
+            title=value_or_none(item.get('title')),
+            link=link,
+            text=parse_text(item.get('text')),
+            date=parse_date(item.get('date')),
+            rating=parse_rating(item.get('rating')),
+        )
+        for key, value in item.items():
+            if key.startswith('rating_'):
+                field_name = sub_rating_field(key)
+                if field_name in SUB_RATING_FIELDS:
+                    setattr(review, field_name, parse_rating(value))
+                elif field_name not in UNKNOWN_SUB_RATINGS:
+                    # Once per label, every review of the location would repeat it
+                    UNKNOWN_SUB_RATINGS.add(field_name)
+                    Actor.log.warning(f'Dropping the sub-rating {key}, it is not part of the review schema')
+        return review
+
+    def to_dict(self):
+        # The sub-ratings of the other kinds of location would only be nulls in every item
+        data = {name: getattr(self, name) for name in BASE_FIELDS}
+        for name in SUB_RATING_FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                data[name] = value
+        return data
+
+BASE_FIELDS = tuple(field.name for field in fields(Review) if not field.name.startswith('rating_'))
+SUB_RATING_FIELDS = tuple(field.name for field in fields(Review) if field.name.startswith('rating_'))
+UNKNOWN_SUB_RATINGS = set()
+
+def encode_review(item):
+    # Dataset items are encoded once, as JSON bytes, when they are pushed to the dataset sink
+    review = Review.from_item(item) if isinstance(item, dict) else item
+    return orjson.dumps(review.to_dict())
+
+def value_or_none(value):
+    if isinstance(value, str) and not value.strip():
+        return None
+    return value
+
+def parse_text(text):
+    # A preview keeps its ellipsis but loses the text of the "More" link
+    text = value_or_none(text)
+    return TRUNCATED_TEXT_PATTERN.sub(r'\1', text) if text else None
+
+def parse_review_id(review_id, link=None):
+    review_id = value_or_none(review_id)
+    if isinstance(review_id, int) or (isinstance(review_id, str) and review_id.isdigit()):
+        return int(review_id)
+    # The link of a review is its ShowUserReviews page, which has the id as '-r<id>-'
+    match = REVIEW_ID_IN_LINK_PATTERN.search(link or '')
+    return int(match.group(1)) if match else None
+
+def parse_rating(rating):
+    # The extractors hand over ratings as numbers, out of range values are dropped
+    if isinstance(rating, (int, float)) and 0 <= rating <= MAX_RATING:
+        return float(rating)
+    return None
+
+def parse_date(date):
+    # The page shows dates as 'February 14, 2024', the API as '2024-02-14' or a full timestamp
+    date = value_or_none(date)
+    if not isinstance(date, str):
+        return None
+    date = date.strip()
+    try:
+        return datetime.fromisoformat(date).date().isoformat()
+    except ValueError:
+        pass
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(date, date_format).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+def sub_rating_field(key):
+    # 'rating_In-flight_Entertainment' -> 'rating_in_flight_entertainment'
+    label = LABEL_SEPARATORS_PATTERN.sub('_', key[len('rating_'):].lower()).strip('_')
+    return 'rating_' + label
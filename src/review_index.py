@@ -0,0 +1,83 @@
+from array import array
+from bisect import bisect_left, insort
+
+from apify import Actor
+
+FALLBACK_REVIEW_INDEX_STORE = 'tripadvisor-review-index'
+
+class ReviewIndex:
+    """The ids of the reviews of one location that are already in a dataset.
+
+    Kept as a sorted array of 64-bit integers, which takes 8 bytes per review both in
+    memory and in the key-value store.
+    """
+
+    def __init__(self, location_id, review_ids=None):
+        self.location_id = location_id
+        self._review_ids = array('Q', sorted(review_ids or []))
+        self.dirty = False
+
+    def __len__(self):
+        return len(self._review_ids)
+
+    def __contains__(self, review_id):
+        review_id = to_review_number(review_id)
+        if review_id is None:
+            return False
+        position = bisect_left(self._review_ids, review_id)
+        return position < len(self._review_ids) and self._review_ids[position] == review_id
+
+    def add(self, review_id):
+        number = to_review_number(review_id)
+        if number is None or review_id in self:
+            return
+        insort(self._review_ids, number)
+        self.dirty = True
+
+    def to_bytes(self):
+        return self._review_ids.tobytes()
+
+    @classmethod
+    def from_bytes(cls, location_id, data):
+        index = cls(location_id)
+        index._review_ids.frombytes(data)
+        return index
+
+def to_review_number(review_id):
+    # Ids come from the page as strings, skip reviews without one
+    try:
+        return int(review_id)
+    except (TypeError, ValueError):
+        return None
+
+class ReviewIndexStore:
+    """Loads and saves the review index of every location in a named key-value store."""
+
+    def __init__(self, store):
+        self.store = store
+        self._indexes = {}
+
+    @classmethod
+    async def open(cls, name=FALLBACK_REVIEW_INDEX_STORE):
+        return cls(await Actor.open_key_value_store(name=name))
+
+    async def get(self, location_id):
+        if location_id not in self._indexes:
+            data = await self.store.get_value(index_key(location_id))
+            index = ReviewIndex.from_bytes(location_id, data) if data else ReviewIndex(location_id)
+            Actor.log.info(f'Loaded {len(index)} known reviews of location {location_id}.')
+            self._indexes[location_id] = index
+        return self._indexes[location_id]
+
+    async def save(self, index):
+        if not index.dirty:
+            return
+        await self.store.set_value(index_key(index.location_id), index.to_bytes(), content_type='application/octet-stream')
+        index.dirty = False
+
+    async def persist(self):
+        for index in self._indexes.values():
+            await self.save(index)
+
+def index_key(location_id):
+    return f'location-{location_id}'
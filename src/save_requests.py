@@ -1,61 +1,72 @@
 # save_requests.py
 
-import gzip
-from io import BytesIO
+import json
+import logging
 import os
-import uuid
-import sys
+import socket
 
-# Base storage path
-STORAGE_PATH = "storage"
-CAPTURES_PATH = os.path.join(STORAGE_PATH, "captures")
+# Address of the actor's capture server, e.g. '127.0.0.1:40123'
+CAPTURE_ADDRESS = os.environ.get("CAPTURE_ADDRESS", "")
+CONNECT_TIMEOUT = 5
 
-# Ensure the captures path exists
-if not os.path.exists(CAPTURES_PATH):
-    os.makedirs(CAPTURES_PATH)
+# Set by the browser on every request, tells the actor which job a response belongs to
+JOB_HEADER = "X-Capture-Job"
 
-unique_id = sys.argv[-1]
+# Responses of the TripAdvisor APIs that carry review data
+CAPTURE_URL_PATTERNS = [
+    '/data/graphql/ids',
+    '/data/graphql/batched',
+]
 
-captured_file_path = os.path.join(CAPTURES_PATH, f"captured_requests_{unique_id}.txt")
-error_file_path = os.path.join(CAPTURES_PATH, f"errors_{unique_id}.txt")
+capture_socket = None
 
-# Ensure a clean start (overwrite if exists)
-with open(captured_file_path, "w") as _: pass
-with open(error_file_path, "w") as _: pass
+def send_record(record):
+    global capture_socket
+    # One JSON record per line, json.dumps never emits raw newlines
+    line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+    for attempt in range(2):
+        try:
+            if capture_socket is None:
+                host, port = CAPTURE_ADDRESS.rsplit(":", 1)
+                capture_socket = socket.create_connection((host, int(port)), timeout=CONNECT_TIMEOUT)
+                capture_socket.settimeout(None)
+            capture_socket.sendall(line)
+            return
+        except OSError:
+            # The actor may have restarted its server, reconnect once
+            if capture_socket is not None:
+                capture_socket.close()
+                capture_socket = None
+            if attempt:
+                raise
+
+def request(flow):
+    # Never leak the job tag to TripAdvisor
+    job = flow.request.headers.pop(JOB_HEADER, None)
+    if job:
+        flow.metadata['job'] = job
 
 def response(flow):
     try:
-        if 'api/v5/vendors' in flow.request.url:
-
-            with open(captured_file_path, "a", encoding='utf-8') as f:
-                f.write("\n#####\n")
-                f.write("URL: " + flow.request.url + "\n")
-                headers_to_log = [
-                    #"Content-Type",
-                    #"Content-Length",
-                    #"X-Frame-Options",
-                    #"X-Content-Type-Options",
-                    #"X-XSS-Protection",
-                    #"Access-Control-Allow-Origin"
-                ]
-
-                for header in headers_to_log:
-                    value = flow.response.headers.get(header, "N/A")
-                    f.write(f"{header}: {value}\n")
-
-                content_encoding = flow.response.headers.get("Content-Encoding", "")
-                
-                if "gzip" in content_encoding:
-                    buffer = BytesIO(flow.response.content)
-                    try:
-                        with gzip.GzipFile(fileobj=buffer, mode="rb") as decompressed:
-                            body = decompressed.read().decode('utf-8', 'ignore')
-                            f.write("Response Body:\n" + body + "\n\n")
-                    except:
-                        f.write("Response Body:\n" + flow.response.text + "\n\n")
-                else:
-                    f.write("Response Body:\n" + flow.response.text + "\n\n")
+        if not any(pattern in flow.request.url for pattern in CAPTURE_URL_PATTERNS):
+            return
+
+        content_type = flow.response.headers.get("Content-Type", "")
+        if "json" not in content_type:
+            return
+
+        # mitmproxy already undoes the Content-Encoding (gzip, br, ...) of the body
+        send_record({
+            'job': flow.metadata.get('job'),
+            'url': flow.request.url,
+            'status_code': flow.response.status_code,
+            'data': json.loads(flow.response.get_text(strict=False)),
+        })
 
     except Exception as e:
-        with open(error_file_path, "a") as error_file:
-            error_file.write(f"Error processing request to {flow.request.url}: {str(e)}\n")
\ No newline at end of file
+        logging.warning(f"Error processing request to {flow.request.url}: {str(e)}")
+
+def done():
+    if capture_socket is not None:
+        capture_socket.close()
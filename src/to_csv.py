@@ -1,53 +1,190 @@
-import json
+# Exports the items of a local dataset folder (storage/datasets/default) to CSV, NDJSON, Parquet or Arrow.
+#
+# The items are streamed from disk, so the memory use does not grow with the dataset. CSV, Parquet
+# and Arrow need all columns up front: a first pass collects the union of the keys of all items (the
+# rating_* columns differ between reviews), the second pass writes the rows.
+#
+# Run from the repository root:
+#     python -m src.to_csv
+#     python -m src.to_csv storage/datasets/default --format parquet --output reviews.parquet --workers 8
+
+import argparse
 import csv
-import os
-import glob
 import datetime
+import glob
+import json
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-def jsons_to_csv(folder_path, output_csv_path):
-    # Check if folder exists
-    if not os.path.exists(folder_path):
-        print(f"Folder does not exist: {folder_path}")
+DEFAULT_FOLDER = 'storage/datasets/default'
+METADATA_FILE = '__metadata__.json'
+FORMATS = ('csv', 'ndjson', 'parquet', 'arrow')
+ARROW_BATCH_SIZE = 10000  # Rows per Parquet row group / Arrow record batch
+READ_AHEAD = 4  # Files read ahead per worker in the parallel mode
+
+def list_item_files(folder_path):
+    # The local storage keeps one item per file, named by its index
+    return sorted(
+        path for path in glob.glob(os.path.join(folder_path, '*.json'))
+        if os.path.basename(path) != METADATA_FILE
+    )
+
+def read_item_file(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        data = json.load(file)
+    return data if isinstance(data, list) else [data]
+
+def iter_items(paths, workers=1):
+    # Items in file order. With several workers the files are read in parallel, but only
+    # a few files ahead of the consumer, so memory stays bounded.
+    if workers <= 1:
+        for path in paths:
+            yield from read_item_file(path)
         return
 
-    # List to hold all json data
-    all_data = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for path in paths:
+            pending.append(executor.submit(read_item_file, path))
+            if len(pending) >= workers * READ_AHEAD:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
 
+def scan_schema(items):
+    # Union of the keys of all items in first seen order, with the Python types seen per key
+    schema = {}
+    for item in items:
+        for key, value in item.items():
+            schema.setdefault(key, set())
+            if value is not None:
+                schema[key].add(type(value))
+    return schema
+
+def cell_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+def write_csv(items, columns, output_path):
+    count = 0
+    with open(output_path, 'w', newline='', encoding='utf-8') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(columns)
+        for item in items:
+            # Missing columns stay empty instead of shifting the row
+            writer.writerow([cell_value(item.get(column, '')) for column in columns])
+            count += 1
+    return count
+
+def write_ndjson(items, output_path):
+    count = 0
+    with open(output_path, 'w', encoding='utf-8') as ndjson_file:
+        for item in items:
+            ndjson_file.write(json.dumps(item, ensure_ascii=False) + '\n')
+            count += 1
+    return count
+
+def import_pyarrow():
     try:
-        # Find all json files in the folder
-        for file_name in glob.glob(os.path.join(folder_path, '*.json')):
-            with open(file_name, 'r', encoding='utf-8') as file:  # Specify encoding here
-                data = json.load(file)
-                all_data.append(data)
+        import pyarrow
+    except ImportError:
+        raise SystemExit('The parquet and arrow formats need pyarrow: pip install pyarrow')
+    return pyarrow
+
+def arrow_schema(pyarrow, schema):
+    fields = []
+    for column, types in schema.items():
+        if types == {bool}:
+            arrow_type = pyarrow.bool_()
+        elif types == {int}:
+            arrow_type = pyarrow.int64()
+        elif types and types <= {int, float}:
+            arrow_type = pyarrow.float64()
+        else:
+            arrow_type = pyarrow.string()
+        fields.append(pyarrow.field(column, arrow_type))
+    return pyarrow.schema(fields)
+
+def iter_record_batches(pyarrow, items, schema):
+    string_columns = {field.name for field in schema if field.type == pyarrow.string()}
+    rows = []
+    for item in items:
+        rows.append({
+            column: (json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else str(value))
+            if column in string_columns and value is not None else value
+            for column, value in item.items()
+        })
+        if len(rows) >= ARROW_BATCH_SIZE:
+            yield pyarrow.RecordBatch.from_pylist(rows, schema=schema)
+            rows = []
+    if rows:
+        yield pyarrow.RecordBatch.from_pylist(rows, schema=schema)
 
-        # Check if data is found
-        if not all_data:
-            print("No JSON data found in the folder.")
-            return
+def write_parquet(items, schema, output_path):
+    pyarrow = import_pyarrow()
+    import pyarrow.parquet
 
-        # Write data to csv
-        with open(output_csv_path, 'w', newline='', encoding='utf-8') as csv_file:
-            writer = csv.writer(csv_file)
+    arrow = arrow_schema(pyarrow, schema)
+    count = 0
+    with pyarrow.parquet.ParquetWriter(output_path, arrow) as writer:
+        for batch in iter_record_batches(pyarrow, items, arrow):
+            writer.write_batch(batch)
+            count += batch.num_rows
+    return count
 
-            # Writing header
-            writer.writerow(all_data[0].keys())
+def write_arrow(items, schema, output_path):
+    pyarrow = import_pyarrow()
+    import pyarrow.ipc
 
-            # Writing data rows
-            for data in all_data:
-                writer.writerow(data.values())
+    arrow = arrow_schema(pyarrow, schema)
+    count = 0
+    with pyarrow.OSFile(output_path, 'wb') as sink, pyarrow.ipc.new_file(sink, arrow) as writer:
+        for batch in iter_record_batches(pyarrow, items, arrow):
+            writer.write_batch(batch)
+            count += batch.num_rows
+    return count
+
+def export_dataset(folder_path, output_path, output_format='csv', workers=1):
+    paths = list_item_files(folder_path)
+    if not paths:
+        print(f"No JSON data found in the folder: {folder_path}")
+        return 0
+
+    if output_format == 'ndjson':
+        return write_ndjson(iter_items(paths, workers), output_path)
+
+    schema = scan_schema(iter_items(paths, workers))
+    if output_format == 'csv':
+        return write_csv(iter_items(paths, workers), list(schema), output_path)
+    if output_format == 'parquet':
+        return write_parquet(iter_items(paths, workers), schema, output_path)
+    if output_format == 'arrow':
+        return write_arrow(iter_items(paths, workers), schema, output_path)
+    raise ValueError(f'Unknown output format: {output_format}')
+
+def jsons_to_csv(folder_path, output_csv_path):
+    return export_dataset(folder_path, output_csv_path, 'csv')
 
-        print(f"CSV file created successfully: {output_csv_path}")
+def main():
+    parser = argparse.ArgumentParser(description='Export the items of a local dataset folder.')
+    parser.add_argument('folder', nargs='?', default=DEFAULT_FOLDER, help=f'Dataset folder, {DEFAULT_FOLDER} by default')
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--output', help='Output file, output_<date and time>.<format> by default')
+    parser.add_argument('--workers', type=int, default=1, help='Threads reading the item files')
+    args = parser.parse_args()
 
-    except Exception as e:
-        print(f"An error occurred: {e}")
+    if not os.path.exists(args.folder):
+        raise SystemExit(f"Folder does not exist: {args.folder}")
 
-# Current date and time
-current_datetime = datetime.datetime.now()
-formatted_datetime = current_datetime.strftime("%Y_%m_%d_%H_%M_%S")
+    output_path = args.output
+    if not output_path:
+        formatted_datetime = datetime.datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
+        output_path = f'output_{formatted_datetime}.{args.format}'
 
-folder_path = 'storage/datasets/default'  # Replace with your folder path
-output_csv_filename = 'output'  # Replace with your desired output CSV file base name
-output_csv_filename_wt = f'{output_csv_filename}_{formatted_datetime}.csv'
+    count = export_dataset(args.folder, output_path, args.format, args.workers)
+    print(f"Exported {count} items to {output_path}")
 
-# Call the function
-jsons_to_csv(folder_path, output_csv_filename_wt)
+if __name__ == '__main__':
+    main()
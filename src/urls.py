@@ -0,0 +1,28 @@
+import re
+
+REVIEWS_PER_PAGE = 10
+TRIPADVISOR_BASE_URL = 'https://www.tripadvisor.com'
+
+# Review list pages are paginated with an '-or<offset>-' segment right after the
+# review id ('ShowUserReviews-g1-d8729116-r933887478-or10-...') or after 'Reviews'
+# ('Airline_Review-d8729116-Reviews-or10-...'). The first page has no segment.
+PAGE_SEGMENT_PATTERN = re.compile(r'(-r\d+|-Reviews)(?:-or\d+)?(?=-)')
+
+PAGE_OFFSET_PATTERN = re.compile(r'-or(\d+)-')
+
+def build_page_url(url, offset):
+    segment = f'-or{offset}' if offset else ''
+    page_url, replaced = PAGE_SEGMENT_PATTERN.subn(lambda match: match.group(1) + segment, url, count=1)
+    if not replaced:
+        raise ValueError(f'Cannot build paginated URLs for {url}')
+    return page_url
+
+def get_page_offset(url):
+    match = PAGE_OFFSET_PATTERN.search(url)
+    return int(match.group(1)) if match else 0
+
+LOCATION_ID_PATTERN = re.compile(r'-d(\d+)-')
+
+def get_location_id(url):
+    match = LOCATION_ID_PATTERN.search(url)
+    return match.group(1) if match else None
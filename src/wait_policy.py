@@ -0,0 +1,97 @@
+import time
+from collections import deque
+
+from selenium.common.exceptions import TimeoutException
+
+from .metrics import percentile
+
+# Timeouts (in seconds) used until enough latencies of a phase were observed, and the upper bound afterwards
+DEFAULT_TIMEOUTS = {
+    'page_load': 30,
+    'reviews_list': 30,
+    'review_items': 5,
+    'list_update': 10,
+    'scroll': 10,
+    'expand': 5,
+    'capture': 5,
+}
+LATENCY_WINDOW = 50  # Latencies kept per phase, older ones roll out
+MIN_SAMPLES = 5  # Latencies needed before a phase timeout is derived from them
+TIMEOUT_PERCENTILE = 95
+TIMEOUT_HEADROOM = 3.0  # The timeout is this many times the percentile latency
+MIN_TIMEOUT = 1.0
+# A review list that times out fails the request (browser restart, backoff, retry), so it never learns a short timeout
+MIN_TIMEOUTS = {
+    'reviews_list': 5.0,
+}
+MAX_BACKOFF_FACTOR = 4  # After errors the timeouts may grow up to this many times their default
+BACKOFF_BASE_DELAY = 2.0
+MAX_BACKOFF_DELAY = 60.0
+
+class WaitPolicy:
+    """Timeouts of the browser waits, derived from the latencies of one proxy session.
+
+    Every phase (page load, list update, ...) keeps a rolling window of its latencies
+    and times out after TIMEOUT_HEADROOM times their 95th percentile, capped at its
+    default. A fast proxy thus does not sit out the full default on a page that will
+    never render. A timeout doubles the timeout of its own phase, an error (a failed
+    request) doubles the timeouts of all phases and the delay before the next attempt,
+    up to MAX_BACKOFF_FACTOR times. The first success resets them.
+    """
+
+    def __init__(self, defaults=None, window=LATENCY_WINDOW, min_samples=MIN_SAMPLES):
+        self.defaults = dict(DEFAULT_TIMEOUTS, **(defaults or {}))
+        self.window = window
+        self.min_samples = min_samples
+        self.errors = 0
+        self._latencies = {}
+        self._timeouts = {}  # Phase -> timeouts in a row
+
+    def new_session(self):
+        # Latencies and timeouts of the previous proxy session say nothing about the next one, the error streak does
+        self._latencies.clear()
+        self._timeouts.clear()
+
+    def latencies(self, phase):
+        return self._latencies.get(phase, ())
+
+    def timeout(self, phase):
+        default = self.defaults[phase]
+        timeout = default
+        latencies = self.latencies(phase)
+        if len(latencies) >= self.min_samples:
+            learned = percentile(sorted(latencies), TIMEOUT_PERCENTILE) * TIMEOUT_HEADROOM
+            timeout = min(max(learned, MIN_TIMEOUTS.get(phase, MIN_TIMEOUT)), default)
+        return timeout * min(2 ** (self.errors + self._timeouts.get(phase, 0)), MAX_BACKOFF_FACTOR)
+
+    def observe(self, phase, seconds):
+        if phase not in self._latencies:
+            self._latencies[phase] = deque(maxlen=self.window)
+        self._latencies[phase].append(seconds)
+        self._timeouts.pop(phase, None)
+        self.errors = 0
+
+    def timed_out(self, phase):
+        # Not a latency sample, a stalled page would drag the percentile up to the timeout.
+        # Only this phase waits longer, a page that never stops scrolling says nothing about the page loads.
+        self._timeouts[phase] = self._timeouts.get(phase, 0) + 1
+
+    def record_error(self):
+        self.errors += 1
+
+    def backoff_delay(self):
+        if not self.errors:
+            return 0
+        return min(BACKOFF_BASE_DELAY * 2 ** (self.errors - 1), MAX_BACKOFF_DELAY)
+
+    async def wait(self, phase, wait_for):
+        # wait_for takes the timeout and raises TimeoutException like WebDriverWait.until
+        timeout = self.timeout(phase)
+        started = time.monotonic()
+        try:
+            result = await wait_for(timeout)
+        except TimeoutException:
+            self.timed_out(phase)
+            raise
+        self.observe(phase, time.monotonic() - started)
+        return result